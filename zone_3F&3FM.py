@@ -1,9 +1,12 @@
 import sys
-import pandas as pd
 import pygame
 from pygame.locals import *
-import math
-import copy
+from zone_cache import ZoneMapCache
+from zone_events import wait_events
+from zone_grid import accumulate_levels
+from zone_locations import resolve_floor_cells
+from zone_render import build_tile_atlas, draw_grid
+from zone_store import load_floor
 
 WINWIDTH = 1430
 WINHEIGHT = 600
@@ -14,6 +17,7 @@ TILEWIDTH = 5
 TILEHEIGHT = 8
 
 FPS = 30 # frames per second to update the screen
+IDLE_WAIT = True # sleep until an event instead of redrawing FPS times a second
 BRIGHTBLUE = (  0, 170, 255)
 WHITE      = (255, 255, 255)
 BLUE       = (  0,   0, 255) 
@@ -32,8 +36,10 @@ def main():
     global DISPLAYSURF
     global IMAGESDICT
     global TILEMAPPING
+    global TILEATLAS
     global BASICFONT
     global ZONENAMEFONT
+    global MAPCACHE
 
     # Pygame initialization and basic set up of the global variables.
     pygame.init()
@@ -87,14 +93,18 @@ def main():
                    '5': IMAGESDICT['lots_5_batched'],
                   }
 
+    # The pixels of every tile in TILEMAPPING, indexed by the tile code of
+    # the zone maps, so draw_map() can compose a whole map at once.
+    TILEATLAS = build_tile_atlas(TILEMAPPING, BGCOLOR)
+
     # read the zone maps
-    zones_3F = read_zone_file('3F_zone_maps.txt')
-    zones_3FM = read_zone_file('3FM_zone_maps.txt')
+    zones_3F = read_zone_file('3F_zone_maps.txt', 'locations_3F.csv', '3F_zone_layout.json')
+    zones_3FM = read_zone_file('3FM_zone_maps.txt', 'locations_3FM.csv', '3FM_zone_layout.json')
     zone_name = [zones_3F['zone_name'], zones_3FM['zone_name']]
-    # read the data of locations, including the aisle, bay values of a location
-    locations_df = {}
-    locations_df['3F'] = pd.read_csv('locations_3F.csv', index_col = 0)
-    locations_df['3FM'] = pd.read_csv('locations_3FM.csv', index_col = 0)
+    # the cell of every location id in the zone maps, built once
+    location_index = {}
+    location_index['3F'] = zones_3F['location_index']
+    location_index['3FM'] = zones_3FM['location_index']
     # read the time-dependent shipments changes
     ss_logs = read_shipments_batchs_logs('shipments_batchs_logs.txt')
         # key = timestamp
@@ -102,7 +112,9 @@ def main():
 
     # currently, we show all picking zones in 3F & 3FM
     mapObj = [zones_3F['map_obj'], zones_3FM['map_obj']]
-    mapObj_initial = copy.deepcopy(mapObj)
+    mapObj_initial = [obj.copy() for obj in mapObj]
+    # the updated zone maps of every timestamp, built once per timestamp
+    MAPCACHE = ZoneMapCache(update_map)
     start_screen(mapObj) # show the title screen until the user presses a key
 
     # timestamp
@@ -119,7 +131,7 @@ def main():
         shipments = ss_logs[timestamps[ss_index]]['sequence'] # the list of shipments pending to be batched
         batchs = ss_logs[timestamps[ss_index]]['batch']  # the list of shipments batched
         
-        result = run_zone(mapObj, mapObj_initial, zone_name, locations_df, timestamp, ppid, shipments, batchs, ss_length)
+        result = run_zone(mapObj, mapObj_initial, zone_name, location_index, timestamp, ppid, shipments, batchs, ss_length)
 
         if result == 'next':
             # Go to the next level.
@@ -139,7 +151,7 @@ def main():
             pass # Do nothing. Loop re-calls run_zone() to reset the zone
 
 
-def run_zone(mapObj, mapObj_initial, zone_name, locations_df, timestamp, ppid, shipments, batchs, ss_length):
+def run_zone(mapObj, mapObj_initial, zone_name, location_index, timestamp, ppid, shipments, batchs, ss_length):
 
     # the title: current zone_type name
     zoneSurf = BASICFONT.render('Layer: {} '.format(zone_name), 1, TEXTCOLOR)
@@ -147,13 +159,15 @@ def run_zone(mapObj, mapObj_initial, zone_name, locations_df, timestamp, ppid, s
     zoneRect.topleft = (20,  10)
     # batchsize
     batchsize = len(batchs)
+    mapNeedsRedraw = True
 
     while True: # main game loop
         # Reset these variables:
         time_change = None
-        mapNeedsRedraw = True
 
-        for event in pygame.event.get(): # event handling loop
+        # sleep until an event, unless the map is still to be drawn
+        timeout = 0 if mapNeedsRedraw else None
+        for event in next_events(timeout): # event handling loop
             if event.type == QUIT:
                 terminate()
 
@@ -172,104 +186,62 @@ def run_zone(mapObj, mapObj_initial, zone_name, locations_df, timestamp, ppid, s
                 elif event.key == K_r:
                     return 'reset' # Reset the zone map.
 
-        mapObj, changed = update_map(mapObj_initial, locations_df, shipments, batchs)
+        # only rebuilt when the timestamp, layout or location table changes
+        mapObj_3F, changed_3F = MAPCACHE.get('3F', timestamp, mapObj_initial[0], location_index['3F'], shipments, batchs)
+        mapObj_3FM, changed_3FM = MAPCACHE.get('3FM', timestamp, mapObj_initial[1], location_index['3FM'], shipments, batchs)
+        mapObj = [mapObj_3F, mapObj_3FM]
 
-        if changed:
+        if changed_3F or changed_3FM:
             mapNeedsRedraw = True
 
-        DISPLAYSURF.fill(BGCOLOR)
-
         if mapNeedsRedraw:
-            mapSurf = draw_map(mapObj)
+            mapSurf = draw_map(mapObj[-1])
             mapNeedsRedraw = False
 
-        # Adjust mapSurf's Rect object
-        mapSurfRect = mapSurf.get_rect()
-        mapSurfRect.midbottom = (HALF_WINWIDTH, WINHEIGHT-10)
+            DISPLAYSURF.fill(BGCOLOR)
 
-        # Draw mapSurf to the DISPLAYSURF Surface object.
-        DISPLAYSURF.blit(mapSurf, mapSurfRect)
-        DISPLAYSURF.blit(zoneSurf, zoneRect)
+            # Adjust mapSurf's Rect object
+            mapSurfRect = mapSurf.get_rect()
+            mapSurfRect.midbottom = (HALF_WINWIDTH, WINHEIGHT-10)
 
-        draw_border(mapObj)
+            # Draw mapSurf to the DISPLAYSURF Surface object.
+            DISPLAYSURF.blit(mapSurf, mapSurfRect)
+            DISPLAYSURF.blit(zoneSurf, zoneRect)
 
-        stepSurf = BASICFONT.render('{}, PPID: {}, batchjobsize: {}'.format(timestamp, ppid, batchsize), 1, TEXTCOLOR)
-        stepRect = stepSurf.get_rect()
-        stepRect.topleft = (20, 30)
-        DISPLAYSURF.blit(stepSurf, stepRect)
+            draw_border(mapObj[-1])
 
-        pygame.display.update() # draw DISPLAYSURF to the screen.
-        FPSCLOCK.tick()
+            stepSurf = BASICFONT.render('{}, PPID: {}, batchjobsize: {}'.format(timestamp, ppid, batchsize), 1, TEXTCOLOR)
+            stepRect = stepSurf.get_rect()
+            stepRect.topleft = (20, 30)
+            DISPLAYSURF.blit(stepSurf, stepRect)
 
-def update_map(mapObj_initial, locations_df, shipments, batchs):
+            pygame.display.update() # draw DISPLAYSURF to the screen.
+
+def update_map(mapObj_initial, location_index, shipments, batchs):
     # update the shipments in the zone map
-    # mapObjCopy = mapObj[:]
-    mapObj = copy.deepcopy(mapObj_initial)
 
     # e.g. 'sequence': [176653, 176062, 180793], 'batch': [176265, 175953, 175996, 176166]
     if shipments: # if there are shipments (ready to pick) in the zone map 
-        # update the map
-        for i in range(len(shipments)):
-            if shipments[i] in locations_df.index:
-                location = locations_df.loc[shipments[i]]
-                zone = location['zone']
-                aisle = location['aisle']
-                bay = location['bay']
-
-                y, x = location_xy(zone, aisle, bay)
-
-                if mapObj[x][y] == '#': # the (x, y) position is a 'lot'
-                    mapObj[x][y] = 'a'
-                elif mapObj[x][y] == 'a':
-                    mapObj[x][y] = 'b'
-                elif mapObj[x][y] == 'b':
-                    mapObj[x][y] = 'c'
-                elif mapObj[x][y] == 'c':
-                    mapObj[x][y] = 'd'
-                elif mapObj[x][y] == 'd':
-                    mapObj[x][y] = 'e'
-        if batchs: 
-            # update the batched shipments in the map
-            for i in range(len(batchs)):
-                if batchs[i] in locations_df.index:
-                    location = locations_df.loc[batchs[i]]
-                    zone = location['zone']
-                    aisle = location['aisle']
-                    bay = location['bay']
-
-                    y, x = location_xy(zone, aisle, bay)
-
-                    if mapObj[x][y] in ('#','a','b','c','d','e'):
-                        mapObj[x][y] = '1'
-                    elif mapObj[x][y] == '1':
-                        mapObj[x][y] = '2'
-                    elif mapObj[x][y] == '2':
-                        mapObj[x][y] = '3'
-                    elif mapObj[x][y] == '3':
-                        mapObj[x][y] = '4'
-                    elif mapObj[x][y] == '4':
-                        mapObj[x][y] = '5'
-
+        # pending: lot -> a -> ... -> e, batched: any lot -> 1 -> ... -> 5
+        mapObj = accumulate_levels(mapObj_initial,
+                                   resolve_floor_cells(location_index, shipments),
+                                   resolve_floor_cells(location_index, batchs))
         return mapObj, True # the map needs to redraw
 
-    return mapObj, False # the map doesn't need to redraw
+    return mapObj_initial.copy(), False # the map doesn't need to redraw
 
 
-def read_zone_file(filename):
-    with open(filename, 'r') as f:
-        lines = f.readlines()
-
-    h = len(lines) #
-    w = len(lines[0].rstrip().split(' ')) #
-    # Convert maps to a 2-d array map object
-    map_obj = []
-    for x in range(h):
-        map_obj.append(lines[x].rstrip().split(' '))
+def read_zone_file(filename, locations_filename, layout_filename):
+    # the zone map and the cell of every location id in it, from the
+    # compiled cache when it is up to date, see load_floor()
+    map_obj, location_index, _ = load_floor(filename, locations_filename, layout_filename)
+    h, w = map_obj.shape
 
     zones = {'zone_name': filename,
              'height': h,
              'width': w,
              'map_obj': map_obj,
+             'location_index': location_index,
             }
     return zones
 
@@ -297,180 +269,9 @@ def draw_map(mapObj):
 
     # mapSurf will be the single Surface object that the tiles are drawn
     # on, so that it is easy to position the entire map on the DISPLAYSURF
-    # Surface object
-    map_h = len(mapObj)
-    map_w = len(mapObj[0])
-
-    mapSurfWidth = map_w * TILEWIDTH
-    mapSurfHeight = map_h * TILEHEIGHT
-    mapSurf = pygame.Surface((mapSurfWidth, mapSurfHeight))
-    mapSurf.fill(BGCOLOR) # start with a blank color on the surface
-
-    # Draw the tile sprites onto this surface
-    for h in range(map_h):
-        for w in range(map_w):
-            spaceRect = pygame.Rect((w * TILEWIDTH, h * TILEHEIGHT, TILEWIDTH, TILEHEIGHT))
-            if mapObj[h][w] in TILEMAPPING:
-                baseTile = TILEMAPPING[mapObj[h][w]]
-
-            # First draw the base ground/wall tile
-            mapSurf.blit(baseTile, spaceRect)
-
-    return mapSurf
-
-
-def location_xy(zone, aisle, bay):
-    # from the zone, aisle, bay to get the (x, y) position in the zone maps
-    # here only support the zones in DEO1 3FM 
-    # remeber to transpose the x, y values
-    tile_x = 0
-    tile_y = 0
-    if zone == 'A':
-        tile_x = aisle * 3 - 1
-        if bay <= 16:
-            tile_y = math.ceil(bay/2) - 1
-        elif bay <= 32:
-            tile_y = math.ceil(bay/2) 
-        elif bay <= 56:
-            tile_y = math.ceil(bay/2) + 2
-        else:
-            tile_y = math.ceil(bay/2) + 6
-    elif zone == 'AR':
-        tile_x = aisle * 2 + 11
-        tile_y = math.ceil(bay/2)      
-    elif zone == 'B':
-        if aisle == 0: # B0
-            tile_x = aisle * 3 + 23
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) - 1
-            elif bay <= 32:
-                tile_y = math.ceil(bay/2) 
-            elif bay <= 56:
-                tile_y = math.ceil(bay/2) + 2
-            else:
-                tile_y = math.ceil(bay/2) + 6
-        elif aisle == 1 or aisle == 2: # B1, B2
-            tile_x = aisle * 3 + 23
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle == 3: # B3
-            if bay%2 == 1:
-                tile_x = aisle * 3 + 23
-            else:
-                tile_x = aisle * 3 + 26
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle > 3 and aisle < 11: # B4 ~ B10
-            tile_x = aisle * 3 + 26
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle == 11: # B11
-            if bay%2 == 1:
-                tile_x = aisle * 3 + 26
-            else:
-                tile_x = aisle * 3 + 29
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle > 11 and aisle < 20: # B12 ~ B19
-            tile_x = aisle * 3 + 29
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle == 20: # B20
-            if bay%2 == 1:
-                tile_x = aisle * 3 + 29
-            else:
-                tile_x = aisle * 3 + 31
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-    elif zone == 'C':
-        tile_x = aisle * 3 + 94
-        if aisle < 18:
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle == 18:
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) - 1
-            elif bay <= 32:
-                tile_y = math.ceil(bay/2) 
-            elif bay <= 56:
-                tile_y = math.ceil(bay/2) + 2
-            else:
-                tile_y = math.ceil(bay/2) + 6 
-    elif zone == 'D':
-        tile_x = aisle * 3 + 151
-        if bay <= 16:
-            tile_y = math.ceil(bay/2) - 1
-        elif bay <= 32:
-            tile_y = math.ceil(bay/2) 
-        elif bay <= 56:
-            tile_y = math.ceil(bay/2) + 2
-        else:
-            tile_y = math.ceil(bay/2) + 6
-    elif zone == 'E':
-        tile_x = aisle * 3 + 178
-        if aisle == 0:
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) - 1
-            elif bay <= 32:
-                tile_y = math.ceil(bay/2) 
-            elif bay <= 56:
-                tile_y = math.ceil(bay/2) + 2
-            else:
-                tile_y = math.ceil(bay/2) + 6
-        elif aisle > 0:
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) - 1
-            elif bay <= 32:
-                tile_y = math.ceil(bay/2) 
-            elif bay <= 52:
-                tile_y = math.ceil(bay/2) + 2
-            else:
-                tile_y = math.ceil(bay/2) + 10
-    elif zone == 'F':
-        tile_x = aisle * 3 + 208
-        if bay <= 16:
-            tile_y = math.ceil(bay/2) - 1
-        elif bay <= 32:
-            tile_y = math.ceil(bay/2) 
-        elif bay <= 52:
-            tile_y = math.ceil(bay/2) + 2
-        else:
-            tile_y = math.ceil(bay/2) + 10
-
-    if bay%2 == 1:
-        tile_x -= 1
-    else:
-        tile_x += 1
-
-    return tile_x, tile_y
+    # Surface object. The tile pixels of the whole map are assembled from
+    # TILEATLAS with array indexing and written to mapSurf in one call.
+    return draw_grid(mapObj, TILEATLAS)
 
 
 def start_screen(mapObj):
@@ -495,7 +296,8 @@ def start_screen(mapObj):
         mapSurfRect = mapSurf.get_rect()
         mapSurfRect.midtop = (HALF_WINWIDTH, 30)
 
-    mapSurf = draw_map(mapObj)
+    # the window fits one floor: the last one, 3FM, whose borders are drawn
+    mapSurf = draw_map(mapObj[-1])
     mapSurfRect = mapSurf.get_rect()
     mapSurfRect.midbottom = (HALF_WINWIDTH, WINHEIGHT-10)
     # Draw mapSurf to the DISPLAYSURF Surface object
@@ -517,20 +319,21 @@ def start_screen(mapObj):
         DISPLAYSURF.blit(zone_surf, zone_rect)
 
     # Draw borders of zone to the DISPLAYSURF Surface object
-    draw_border(mapObj)
+    draw_border(mapObj[-1])
     
+    # Display the DISPLAYSURF contents to the actual screen.
+    pygame.display.update()
+
     while True: # Main loop for the start screen.
-        for event in pygame.event.get():
+        for event in next_events(): # nothing changes until a key is pressed
             if event.type == QUIT:
                 terminate()
             elif event.type == KEYDOWN:
                 if event.key == K_ESCAPE:
                     terminate()
                 return # user has pressed a key, so return.
-
-        # Display the DISPLAYSURF contents to the actual screen.
-        pygame.display.update()
-        FPSCLOCK.tick()
+            elif event.type == VIDEOEXPOSE:
+                pygame.display.update() # the window was uncovered
 
 
 def draw_border(mapObj):
@@ -588,6 +391,16 @@ def draw_border(mapObj):
     pygame.draw.line(DISPLAYSURF, BLUE, F_bottomleft, F_bottomright)
     pygame.draw.line(DISPLAYSURF, BLUE, F_topright, F_bottomright)
 
+def next_events(timeout=None):
+    # The events to handle next. With IDLE_WAIT the loop sleeps until an
+    # event arrives or timeout milliseconds passed (see wait_events()),
+    # otherwise it polls at FPS frames per second.
+    if IDLE_WAIT:
+        return wait_events(timeout)
+    FPSCLOCK.tick(FPS)
+    return pygame.event.get()
+
+
 def terminate():
     pygame.quit()
     sys.exit()
@@ -1,9 +1,14 @@
 import sys
-import pandas as pd
+import time
 import pygame
 from pygame.locals import *
-import math
-import copy
+from zone_cache import ZoneMapCache
+from zone_events import wait_events
+from zone_grid import accumulate_levels
+from zone_locations import resolve_floor_cells
+from zone_render import blit_layer, blit_to_layer, build_tile_atlas, changed_cells, draw_grid, new_layer, redraw_cells
+from zone_store import load_floor
+from zone_timing import PhaseTimings
 
 WINWIDTH = 1430
 WINHEIGHT = 600
@@ -14,6 +19,9 @@ TILEWIDTH = 5
 TILEHEIGHT = 8
 
 FPS = 30 # frames per second to update the screen
+INCREMENTAL_REDRAW = True # only repaint the tiles that changed between timestamps
+IDLE_WAIT = True # sleep until an event instead of redrawing FPS times a second
+SHOW_TIMINGS = False # show the timing HUD next to the PPID line, t toggles it
 BRIGHTBLUE = (  0, 170, 255)
 WHITE      = (255, 255, 255)
 BLUE       = (  0,   0, 255) 
@@ -21,6 +29,9 @@ BGCOLOR = WHITE
 #TEXTCOLOR = (180, 180, 180)
 TEXTCOLOR = BRIGHTBLUE
 
+# the rolling timings of the phases of run_zone(), shown by the timing HUD
+TIMINGS = PhaseTimings(['update', 'draw', 'border', 'display'])
+
 UP = 'up'
 DOWN = 'down'
 LEFT = 'left'
@@ -32,8 +43,13 @@ def main():
     global DISPLAYSURF
     global IMAGESDICT
     global TILEMAPPING
+    global TILEATLAS
     global BASICFONT
+    global HUDFONT
     global ZONENAMEFONT
+    global MAPCACHE
+    global DISPLAYED
+    global STATICLAYERS
 
     # Pygame initialization and basic set up of the global variables.
     pygame.init()
@@ -43,6 +59,7 @@ def main():
 
     pygame.display.set_caption('Zone Picking')
     BASICFONT = pygame.font.Font('freesansbold.ttf', 18)
+    HUDFONT = pygame.font.Font('freesansbold.ttf', 12)
     ZONENAMEFONT = pygame.font.Font('freesansbold.ttf', 130)
 
     # A global dict value that will contain all the Pygame
@@ -87,11 +104,15 @@ def main():
                    '5': IMAGESDICT['lots_5_batched'],
                   }
 
+    # The pixels of every tile in TILEMAPPING, indexed by the tile code of
+    # the zone maps, so draw_map() can compose a whole map at once.
+    TILEATLAS = build_tile_atlas(TILEMAPPING, BGCOLOR)
+
     # read the zone maps
-    zones = read_zone_file('3F_zone_maps.txt')
+    zones = read_zone_file('3F_zone_maps.txt', 'locations_3F.csv', '3F_zone_layout.json')
     zone_name = zones['zone_name']
-    # read the data of locations, including the aisle, bay values of a location
-    locations_df = pd.read_csv('locations_3F.csv', index_col = 0)
+    # the cell of every location id in the zone map, built once
+    location_index = zones['location_index']
     # read the time-dependent shipments changes
     ss_logs = read_shipments_batchs_logs('shipments_batchs_logs.txt')
         # key = timestamp
@@ -99,7 +120,13 @@ def main():
 
     # currently, we have only one zone map to show (D zone)
     mapObj = zones['map_obj']
-    mapObj_initial = copy.deepcopy(mapObj)
+    mapObj_initial = mapObj.copy()
+    # the updated zone maps of every timestamp, built once per timestamp
+    MAPCACHE = ZoneMapCache(update_map)
+    # what run_zone() has drawn on the screen, for the incremental redraw
+    DISPLAYED = {'mapObj': None, 'timingsRect': None}
+    # the borders, layer name and zone names, drawn once for the layout
+    STATICLAYERS = build_static_layers(mapObj, zone_name)
     start_screen(mapObj) # show the title screen until the user presses a key
 
     # timestamp
@@ -116,7 +143,7 @@ def main():
         shipments = ss_logs[timestamps[ss_index]]['sequence'] # the list of shipments pending to be batched
         batchs = ss_logs[timestamps[ss_index]]['batch']  # the list of shipments batched
         
-        result = run_zone(mapObj, mapObj_initial, zone_name, locations_df, timestamp, ppid, shipments, batchs, ss_length)
+        result = run_zone(mapObj, mapObj_initial, zone_name, location_index, timestamp, ppid, shipments, batchs, ss_length)
 
         if result == 'next':
             # Go to the next level.
@@ -136,21 +163,22 @@ def main():
             pass # Do nothing. Loop re-calls run_zone() to reset the zone
 
 
-def run_zone(mapObj, mapObj_initial, zone_name, locations_df, timestamp, ppid, shipments, batchs, ss_length):
+def run_zone(mapObj, mapObj_initial, zone_name, location_index, timestamp, ppid, shipments, batchs, ss_length):
+    global SHOW_TIMINGS
 
-    # the title: current zone_type name
-    zoneSurf = BASICFONT.render('Layer: {} '.format(zone_name), 1, TEXTCOLOR)
-    zoneRect = zoneSurf.get_rect()
-    zoneRect.topleft = (20,  10)
+    # the title (current zone_type name) and borders
+    staticLayer = STATICLAYERS['zone']
     # batchsize
     batchsize = len(batchs)
+    mapNeedsRedraw = True
 
     while True: # main game loop
         # Reset these variables:
         time_change = None
-        mapNeedsRedraw = True
 
-        for event in pygame.event.get(): # event handling loop
+        # sleep until an event, unless the map is still to be drawn
+        timeout = 0 if mapNeedsRedraw else None
+        for event in next_events(timeout): # event handling loop
             if event.type == QUIT:
                 terminate()
 
@@ -168,105 +196,116 @@ def run_zone(mapObj, mapObj_initial, zone_name, locations_df, timestamp, ppid, s
                     return 'back'
                 elif event.key == K_r:
                     return 'reset' # Reset the zone map.
+                elif event.key == K_t:
+                    SHOW_TIMINGS = not SHOW_TIMINGS # show or hide the timing HUD
+                    mapNeedsRedraw = True
 
-        mapObj, changed = update_map(mapObj_initial, locations_df, shipments, batchs)
+        # only rebuilt when the timestamp, layout or location table changes
+        updateStart = time.perf_counter()
+        mapObj, changed = MAPCACHE.get('3F', timestamp, mapObj_initial, location_index, shipments, batchs)
 
         if changed:
             mapNeedsRedraw = True
 
-        DISPLAYSURF.fill(BGCOLOR)
-
         if mapNeedsRedraw:
-            mapSurf = draw_map(mapObj)
+            TIMINGS.add('update', time.perf_counter() - updateStart)
             mapNeedsRedraw = False
 
-        # Adjust mapSurf's Rect object
-        mapSurfRect = mapSurf.get_rect()
-        mapSurfRect.midbottom = (HALF_WINWIDTH, WINHEIGHT-10)
-
-        # Draw mapSurf to the DISPLAYSURF Surface object.
-        DISPLAYSURF.blit(mapSurf, mapSurfRect)
-        DISPLAYSURF.blit(zoneSurf, zoneRect)
-
-        draw_border(mapObj)
-
-        stepSurf = BASICFONT.render('{}, PPID: {}, batchjobsize: {}'.format(timestamp, ppid, batchsize), 1, TEXTCOLOR)
-        stepRect = stepSurf.get_rect()
-        stepRect.topleft = (20, 30)
-        DISPLAYSURF.blit(stepSurf, stepRect)
-
-        pygame.display.update() # draw DISPLAYSURF to the screen.
-        FPSCLOCK.tick()
-
-def update_map(mapObj_initial, locations_df, shipments, batchs):
+            previous = DISPLAYED['mapObj']
+            if INCREMENTAL_REDRAW and previous is not None and previous.shape == mapObj.shape:
+                # Only repaint the tiles that differ from the map on the screen
+                with TIMINGS.phase('draw'):
+                    cells = changed_cells(previous, mapObj)
+                    dirtyRects = redraw_cells(DISPLAYSURF, mapObj, cells, TILEATLAS, DISPLAYED['topleft'])
+                    tiles = len(cells)
+
+                    # Clear the previous timestamp, PPID, batchjobsize and timings
+                    for rect in [DISPLAYED['stepRect'], DISPLAYED['timingsRect']]:
+                        if rect is not None:
+                            DISPLAYSURF.fill(BGCOLOR, rect)
+                            dirtyRects.append(rect)
+
+                # Put the title and borders back over the repainted parts
+                with TIMINGS.phase('border'):
+                    for rect in dirtyRects:
+                        blit_layer(DISPLAYSURF, staticLayer, rect, rect)
+            else:
+                with TIMINGS.phase('draw'):
+                    mapSurf = draw_map(mapObj)
+
+                    DISPLAYSURF.fill(BGCOLOR)
+
+                    # Adjust mapSurf's Rect object
+                    mapSurfRect = mapSurf.get_rect()
+                    mapSurfRect.midbottom = (HALF_WINWIDTH, WINHEIGHT-10)
+
+                    # Draw mapSurf to the DISPLAYSURF Surface object.
+                    DISPLAYSURF.blit(mapSurf, mapSurfRect)
+                    DISPLAYED['topleft'] = mapSurfRect.topleft
+
+                # Draw the title and borders in one blit
+                with TIMINGS.phase('border'):
+                    blit_layer(DISPLAYSURF, staticLayer)
+                dirtyRects = None # the whole window
+                tiles = mapObj.size
+
+            with TIMINGS.phase('draw'):
+                stepSurf = BASICFONT.render('{}, PPID: {}, batchjobsize: {}'.format(timestamp, ppid, batchsize), 1, TEXTCOLOR)
+                stepRect = stepSurf.get_rect()
+                stepRect.topleft = (20, 30)
+                DISPLAYSURF.blit(stepSurf, stepRect)
+            timingsRect = draw_timings(stepRect) if SHOW_TIMINGS else None
+            DISPLAYED['mapObj'] = mapObj
+            DISPLAYED['stepRect'] = stepRect
+            DISPLAYED['timingsRect'] = timingsRect
+
+            with TIMINGS.phase('display'):
+                if dirtyRects is None:
+                    pygame.display.update() # draw DISPLAYSURF to the screen.
+                else:
+                    dirtyRects.append(stepRect)
+                    if timingsRect is not None:
+                        dirtyRects.append(timingsRect)
+                    pygame.display.update(dirtyRects) # only the changed parts
+            TIMINGS.end_frame(tiles)
+
+
+def draw_timings(stepRect):
+    # Draw the timing HUD to the right of the PPID line: the last, mean and
+    # 95th percentile milliseconds of every phase of run_zone(), the frames
+    # per second and the tiles redrawn. Returns its Rect.
+    timingsSurf = HUDFONT.render(TIMINGS.summary(), 1, TEXTCOLOR)
+    timingsRect = timingsSurf.get_rect()
+    timingsRect.midleft = (stepRect.right + 20, stepRect.centery)
+    DISPLAYSURF.blit(timingsSurf, timingsRect)
+    return timingsRect
+
+
+def update_map(mapObj_initial, location_index, shipments, batchs):
     # update the shipments in the zone map
-    # mapObjCopy = mapObj[:]
-    mapObj = copy.deepcopy(mapObj_initial)
 
     # e.g. 'sequence': [176653, 176062, 180793], 'batch': [176265, 175953, 175996, 176166]
     if shipments: # if there are shipments (ready to pick) in the zone map 
-        # update the map
-        for i in range(len(shipments)):
-            if shipments[i] in locations_df.index:
-                location = locations_df.loc[shipments[i]]
-                zone = location['zone']
-                aisle = location['aisle']
-                bay = location['bay']
-
-                y, x = location_xy(zone, aisle, bay)
-
-                if mapObj[x][y] == '#': # the (x, y) position is a 'lot'
-                    mapObj[x][y] = 'a'
-                elif mapObj[x][y] == 'a':
-                    mapObj[x][y] = 'b'
-                elif mapObj[x][y] == 'b':
-                    mapObj[x][y] = 'c'
-                elif mapObj[x][y] == 'c':
-                    mapObj[x][y] = 'd'
-                elif mapObj[x][y] == 'd':
-                    mapObj[x][y] = 'e'
-        if batchs: 
-            # update the batched shipments in the map
-            for i in range(len(batchs)):
-                if batchs[i] in locations_df.index:
-                    location = locations_df.loc[batchs[i]]
-                    zone = location['zone']
-                    aisle = location['aisle']
-                    bay = location['bay']
-
-                    y, x = location_xy(zone, aisle, bay)
-
-                    if mapObj[x][y] in ('#','a','b','c','d','e'):
-                        mapObj[x][y] = '1'
-                    elif mapObj[x][y] == '1':
-                        mapObj[x][y] = '2'
-                    elif mapObj[x][y] == '2':
-                        mapObj[x][y] = '3'
-                    elif mapObj[x][y] == '3':
-                        mapObj[x][y] = '4'
-                    elif mapObj[x][y] == '4':
-                        mapObj[x][y] = '5'
-
+        # pending: lot -> a -> ... -> e, batched: any lot -> 1 -> ... -> 5
+        mapObj = accumulate_levels(mapObj_initial,
+                                   resolve_floor_cells(location_index, shipments),
+                                   resolve_floor_cells(location_index, batchs))
         return mapObj, True # the map needs to redraw
 
-    return mapObj, False # the map doesn't need to redraw
-
+    return mapObj_initial.copy(), False # the map doesn't need to redraw
 
-def read_zone_file(filename):
-    with open(filename, 'r') as f:
-        lines = f.readlines()
 
-    h = len(lines) # 36
-    w = len(lines[0].rstrip().split(' ')) # 57
-    # Convert maps to a 2-d array map object
-    map_obj = []
-    for x in range(h):
-        map_obj.append(lines[x].rstrip().split(' '))
+def read_zone_file(filename, locations_filename, layout_filename):
+    # the zone map and the cell of every location id in it, from the
+    # compiled cache when it is up to date, see load_floor()
+    map_obj, location_index, _ = load_floor(filename, locations_filename, layout_filename)
+    h, w = map_obj.shape
 
     zones = {'zone_name': '3F',
              'height': h,
              'width': w,
              'map_obj': map_obj,
+             'location_index': location_index,
             }
     return zones
 
@@ -294,185 +333,15 @@ def draw_map(mapObj):
 
     # mapSurf will be the single Surface object that the tiles are drawn
     # on, so that it is easy to position the entire map on the DISPLAYSURF
-    # Surface object
-    map_h = len(mapObj)
-    map_w = len(mapObj[0])
-
-    mapSurfWidth = map_w * TILEWIDTH
-    mapSurfHeight = map_h * TILEHEIGHT
-    mapSurf = pygame.Surface((mapSurfWidth, mapSurfHeight))
-    mapSurf.fill(BGCOLOR) # start with a blank color on the surface
-
-    # Draw the tile sprites onto this surface
-    for h in range(map_h):
-        for w in range(map_w):
-            spaceRect = pygame.Rect((w * TILEWIDTH, h * TILEHEIGHT, TILEWIDTH, TILEHEIGHT))
-            if mapObj[h][w] in TILEMAPPING:
-                baseTile = TILEMAPPING[mapObj[h][w]]
-
-            # First draw the base ground/wall tile
-            mapSurf.blit(baseTile, spaceRect)
-
-    return mapSurf
-
-
-def location_xy(zone, aisle, bay):
-    # from the zone, aisle, bay to get the (x, y) position in the zone maps
-    # here only support the zones in DEO1 3FM 
-    # remeber to transpose the x, y values
-    tile_x = 0
-    tile_y = 0
-    if zone == 'A':
-        tile_x = aisle * 3 - 1
-        if bay <= 16:
-            tile_y = math.ceil(bay/2) - 1
-        elif bay <= 32:
-            tile_y = math.ceil(bay/2) 
-        elif bay <= 56:
-            tile_y = math.ceil(bay/2) + 2
-        else:
-            tile_y = math.ceil(bay/2) + 6
-    elif zone == 'AR':
-        tile_x = aisle * 2 + 11
-        tile_y = math.ceil(bay/2)      
-    elif zone == 'B':
-        if aisle == 0: # B0
-            tile_x = aisle * 3 + 23
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) - 1
-            elif bay <= 32:
-                tile_y = math.ceil(bay/2) 
-            elif bay <= 56:
-                tile_y = math.ceil(bay/2) + 2
-            else:
-                tile_y = math.ceil(bay/2) + 6
-        elif aisle == 1 or aisle == 2: # B1, B2
-            tile_x = aisle * 3 + 23
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle == 3: # B3
-            if bay%2 == 1:
-                tile_x = aisle * 3 + 23
-            else:
-                tile_x = aisle * 3 + 26
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle > 3 and aisle < 11: # B4 ~ B10
-            tile_x = aisle * 3 + 26
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle == 11: # B11
-            if bay%2 == 1:
-                tile_x = aisle * 3 + 26
-            else:
-                tile_x = aisle * 3 + 29
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle > 11 and aisle < 20: # B12 ~ B19
-            tile_x = aisle * 3 + 29
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle == 20: # B20
-            if bay%2 == 1:
-                tile_x = aisle * 3 + 29
-            else:
-                tile_x = aisle * 3 + 31
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-    elif zone == 'C':
-        tile_x = aisle * 3 + 94
-        if aisle < 18:
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle == 18:
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) - 1
-            elif bay <= 32:
-                tile_y = math.ceil(bay/2) 
-            elif bay <= 56:
-                tile_y = math.ceil(bay/2) + 2
-            else:
-                tile_y = math.ceil(bay/2) + 6 
-    elif zone == 'D':
-        tile_x = aisle * 3 + 151
-        if bay <= 16:
-            tile_y = math.ceil(bay/2) - 1
-        elif bay <= 32:
-            tile_y = math.ceil(bay/2) 
-        elif bay <= 56:
-            tile_y = math.ceil(bay/2) + 2
-        else:
-            tile_y = math.ceil(bay/2) + 6
-    elif zone == 'E':
-        tile_x = aisle * 3 + 178
-        if aisle == 0:
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) - 1
-            elif bay <= 32:
-                tile_y = math.ceil(bay/2) 
-            elif bay <= 56:
-                tile_y = math.ceil(bay/2) + 2
-            else:
-                tile_y = math.ceil(bay/2) + 6
-        elif aisle > 0:
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) - 1
-            elif bay <= 32:
-                tile_y = math.ceil(bay/2) 
-            elif bay <= 52:
-                tile_y = math.ceil(bay/2) + 2
-            else:
-                tile_y = math.ceil(bay/2) + 10
-    elif zone == 'F':
-        tile_x = aisle * 3 + 208
-        if bay <= 16:
-            tile_y = math.ceil(bay/2) - 1
-        elif bay <= 32:
-            tile_y = math.ceil(bay/2) 
-        elif bay <= 52:
-            tile_y = math.ceil(bay/2) + 2
-        else:
-            tile_y = math.ceil(bay/2) + 10
-
-    if bay%2 == 1:
-        tile_x -= 1
-    else:
-        tile_x += 1
-
-    return tile_x, tile_y
+    # Surface object. The tile pixels of the whole map are assembled from
+    # TILEATLAS with array indexing and written to mapSurf in one call.
+    return draw_grid(mapObj, TILEATLAS)
 
 
 def start_screen(mapObj):
     # Display the start screen (which has the title and instructions)
     # until the player presses a key. Returns None.
+    DISPLAYED['mapObj'] = None # the whole window is drawn over
     # Position the title image.
     titleRect = IMAGESDICT['title'].get_rect()
     titleRect.top = 10
@@ -489,7 +358,53 @@ def start_screen(mapObj):
     # Draw mapSurf to the DISPLAYSURF Surface object
     DISPLAYSURF.blit(mapSurf, mapSurfRect)
 
-    # Draw zonename to the DISPLAYSURF Surface object
+    # Draw the zone names and borders in one blit
+    blit_layer(DISPLAYSURF, STATICLAYERS['start'])
+
+    # Display the DISPLAYSURF contents to the actual screen.
+    pygame.display.update()
+
+    while True: # Main loop for the start screen.
+        for event in next_events(): # nothing changes until a key is pressed
+            if event.type == QUIT:
+                terminate()
+            elif event.type == KEYDOWN:
+                if event.key == K_ESCAPE:
+                    terminate()
+                return # user has pressed a key, so return.
+            elif event.type == VIDEOEXPOSE:
+                pygame.display.update() # the window was uncovered
+
+
+def build_static_layers(mapObj, zone_name):
+    # The borders, layer name and zone names never change while the layout
+    # stays the same, so they are drawn once onto transparent layers:
+    # 'start' for start_screen() and 'zone' for run_zone()
+    layers = {'start': build_start_layer(mapObj),
+              'zone': build_zone_layer(mapObj, zone_name),
+             }
+    return layers
+
+
+def build_zone_layer(mapObj, zone_name):
+    # the title and borders shown by run_zone()
+    layer = new_layer((WINWIDTH, WINHEIGHT))
+
+    # the title: current zone_type name
+    zoneSurf = BASICFONT.render('Layer: {} '.format(zone_name), 1, TEXTCOLOR)
+    zoneRect = zoneSurf.get_rect()
+    zoneRect.topleft = (20,  10)
+    blit_to_layer(layer, zoneSurf, zoneRect)
+
+    draw_border(layer, mapObj)
+    return layer
+
+
+def build_start_layer(mapObj):
+    # the zone names and borders shown by start_screen()
+    layer = new_layer((WINWIDTH, WINHEIGHT))
+
+    # Draw zonename to the layer
     zonenames = ['A', 'AR', 'B', 'C', 'D', 'E', 'F']
     zone_center_xy = {'A': (70, HALF_WINHEIGHT + 60),
                    'AR': (190, 115),
@@ -502,27 +417,15 @@ def start_screen(mapObj):
         zone_surf = ZONENAMEFONT.render(zonenames[i], 1, TEXTCOLOR)
         zone_rect = zone_surf.get_rect()
         zone_rect.center = zone_center_xy[zonenames[i]]
-        DISPLAYSURF.blit(zone_surf, zone_rect)
-
-    # Draw borders of zone to the DISPLAYSURF Surface object
-    draw_border(mapObj)
-    
-    while True: # Main loop for the start screen.
-        for event in pygame.event.get():
-            if event.type == QUIT:
-                terminate()
-            elif event.type == KEYDOWN:
-                if event.key == K_ESCAPE:
-                    terminate()
-                return # user has pressed a key, so return.
+        blit_to_layer(layer, zone_surf, zone_rect)
 
-        # Display the DISPLAYSURF contents to the actual screen.
-        pygame.display.update()
-        FPSCLOCK.tick()
+    # Draw borders of zone to the layer
+    draw_border(layer, mapObj)
+    return layer
 
 
-def draw_border(mapObj):
-    # draw the border of zones onto the DISPLAYSURF
+def draw_border(surf, mapObj):
+    # draw the border of zones onto surf
     map_h = len(mapObj)
     map_w = len(mapObj[0])
 
@@ -554,27 +457,37 @@ def draw_border(mapObj):
     F_bottomleft = left_blank + 207 * TILEWIDTH, WINHEIGHT - 10
     F_bottomright = left_blank + 237 * TILEWIDTH, WINHEIGHT - 10
 
-    pygame.draw.line(DISPLAYSURF, BLUE, A_topleft, AR_topleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, A_topleft, A_bottomleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, A_bottomleft, B_bottomleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, AR_topleft, AR_topright)
-    pygame.draw.line(DISPLAYSURF, BLUE, AR_topleft, AR_bottomleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, AR_bottomleft, B_topleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, AR_topright, AR_bottomright)
-    pygame.draw.line(DISPLAYSURF, BLUE, B_topleft, B_topright)
-    pygame.draw.line(DISPLAYSURF, BLUE, B_topleft, B_bottomleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, B_bottomleft, B_bottomright)
-    pygame.draw.line(DISPLAYSURF, BLUE, C_topleft, C_topright)
-    pygame.draw.line(DISPLAYSURF, BLUE, C_topleft, C_bottomleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, C_bottomleft, C_bottomright)
-    pygame.draw.line(DISPLAYSURF, BLUE, C_topright, C_bottomright)
-    pygame.draw.line(DISPLAYSURF, BLUE, D_topleft, C_topright)
-    pygame.draw.line(DISPLAYSURF, BLUE, D_topleft, F_topright)
-    pygame.draw.line(DISPLAYSURF, BLUE, D_topright, D_bottomright)
-    pygame.draw.line(DISPLAYSURF, BLUE, D_bottomleft, F_bottomright)
-    pygame.draw.line(DISPLAYSURF, BLUE, F_topleft, F_bottomleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, F_bottomleft, F_bottomright)
-    pygame.draw.line(DISPLAYSURF, BLUE, F_topright, F_bottomright)
+    pygame.draw.line(surf, BLUE, A_topleft, AR_topleft)
+    pygame.draw.line(surf, BLUE, A_topleft, A_bottomleft)
+    pygame.draw.line(surf, BLUE, A_bottomleft, B_bottomleft)
+    pygame.draw.line(surf, BLUE, AR_topleft, AR_topright)
+    pygame.draw.line(surf, BLUE, AR_topleft, AR_bottomleft)
+    pygame.draw.line(surf, BLUE, AR_bottomleft, B_topleft)
+    pygame.draw.line(surf, BLUE, AR_topright, AR_bottomright)
+    pygame.draw.line(surf, BLUE, B_topleft, B_topright)
+    pygame.draw.line(surf, BLUE, B_topleft, B_bottomleft)
+    pygame.draw.line(surf, BLUE, B_bottomleft, B_bottomright)
+    pygame.draw.line(surf, BLUE, C_topleft, C_topright)
+    pygame.draw.line(surf, BLUE, C_topleft, C_bottomleft)
+    pygame.draw.line(surf, BLUE, C_bottomleft, C_bottomright)
+    pygame.draw.line(surf, BLUE, C_topright, C_bottomright)
+    pygame.draw.line(surf, BLUE, D_topleft, C_topright)
+    pygame.draw.line(surf, BLUE, D_topleft, F_topright)
+    pygame.draw.line(surf, BLUE, D_topright, D_bottomright)
+    pygame.draw.line(surf, BLUE, D_bottomleft, F_bottomright)
+    pygame.draw.line(surf, BLUE, F_topleft, F_bottomleft)
+    pygame.draw.line(surf, BLUE, F_bottomleft, F_bottomright)
+    pygame.draw.line(surf, BLUE, F_topright, F_bottomright)
+
+def next_events(timeout=None):
+    # The events to handle next. With IDLE_WAIT the loop sleeps until an
+    # event arrives or timeout milliseconds passed (see wait_events()),
+    # otherwise it polls at FPS frames per second.
+    if IDLE_WAIT:
+        return wait_events(timeout)
+    FPSCLOCK.tick(FPS)
+    return pygame.event.get()
+
 
 def terminate():
     pygame.quit()
@@ -1,9 +1,19 @@
 import sys
-import pandas as pd
+import time
+import numpy as np
 import pygame
 from pygame.locals import *
-import math
-import copy
+from zone_cache import TimelineMaps, ZoneMapCache
+from zone_distance import load_distance_table
+from zone_events import wait_events
+from zone_grid import accumulate_levels
+from zone_locations import NOT_ON_FLOOR, resolve_known_cells
+from zone_logs import ShipmentsTimeline, iter_shipments_batchs_logs
+from zone_metrics import ViewerMetrics
+from zone_render import blit_layer, blit_to_layer, build_tile_atlas, changed_cells, draw_grid, draw_route_layer, new_layer, redraw_cells
+from zone_route import RouteCache, route_cells
+from zone_store import load_floor
+from zone_timing import PhaseTimings
 
 WINWIDTH = 1230
 WINHEIGHT = 890
@@ -14,6 +24,20 @@ TILEWIDTH = 5
 TILEHEIGHT = 8
 
 FPS = 30 # frames per second to update the screen
+INCREMENTAL_REDRAW = True # only repaint the tiles that changed between timestamps
+IDLE_WAIT = True # sleep until an event or timed work instead of redrawing FPS times a second
+FOLLOW_LOGS = True # keep reading the lines appended to the shipments log
+LOGS_POLL_INTERVAL = 500 # milliseconds between looking for new lines
+MAX_SNAPSHOTS = 10000 # the oldest timestamps are dropped after this many
+PRECOMPUTE_TIMELINE = True # work out the maps of every timestamp at the start
+KEYFRAME_INTERVAL = 64 # keep the precomputed maps as a full map every this many plus deltas, None for all full maps
+KEYREPEAT_DELAY = 300 # milliseconds before a held n or b key repeats
+KEYREPEAT_INTERVAL = 30 # milliseconds between the repeats
+SHOW_TIMINGS = False # show the timing HUD next to the PPID line, t toggles it
+SHOW_ROUTES = False # draw the walking route of the batch over the maps, p toggles it
+PATHCOLORKEY = (195, 195, 195) # the floor color around the line of the path tiles
+METRICS_FILE = None # e.g. 'zone_metrics.jsonl', append a JSON line per snapshot shown and frame drawn
+METRICS_PORT = None # e.g. 9108, serve the metrics at http://127.0.0.1:METRICS_PORT/metrics
 BRIGHTBLUE = (  0, 170, 255)
 WHITE      = (255, 255, 255)
 BLUE       = (  0,   0, 255) 
@@ -21,6 +45,15 @@ BGCOLOR = WHITE
 #TEXTCOLOR = (180, 180, 180)
 TEXTCOLOR = BRIGHTBLUE
 
+# the rolling timings of the phases of run_zone(), shown by the timing HUD
+TIMINGS = PhaseTimings(['update', 'draw', 'border', 'display'])
+# the counters exported by METRICS_FILE and METRICS_PORT, None when neither is set
+METRICS = None
+# the path tiles of the routes of the batches shown, and the distance
+# tables they are routed on, loaded the first time a route is shown
+ROUTES = RouteCache()
+DISTANCES = {}
+
 UP = 'up'
 DOWN = 'down'
 LEFT = 'left'
@@ -28,13 +61,90 @@ RIGHT = 'right'
 
 
 def main():
+    global MAPCACHE
+    global DISPLAYED
+    global STATICLAYERS
+    global METRICS
+
+    init_graphics()
+    pygame.key.set_repeat(KEYREPEAT_DELAY, KEYREPEAT_INTERVAL) # hold n or b to fast-forward or rewind
+
+    # read the zone maps and the locations
+    floor_name, mapObj, location_index = read_layout()
+
+    # currently, we show all picking zones in 3F & 3FM
+    mapObj_initial = [obj.copy() for obj in mapObj]
+    # the updated zone maps of every timestamp, built once per timestamp
+    MAPCACHE = ZoneMapCache(update_map)
+    # read the time-dependent shipments changes, and the ones appended later
+    timeline = ShipmentsTimeline('shipments_batchs_logs.txt', follow=FOLLOW_LOGS, max_snapshots=MAX_SNAPSHOTS,
+                                 on_change=lambda timestamp: MAPCACHE.invalidate(timestamp=timestamp))
+        # timeline[timestamp] = {'ppid': [ ], 'sequence': [ , , ], 'batch': [ , , ]}
+    if METRICS_FILE or METRICS_PORT:
+        METRICS = ViewerMetrics(METRICS_FILE)
+        if METRICS_PORT:
+            METRICS.serve(METRICS_PORT)
+    poll_logs(timeline)
+    # what run_zone() has drawn on the screen, for the incremental redraw
+    DISPLAYED = {'mapObj': None, 'timingsRect': None, 'routes': [None, None], 'routeLayers': [None, None]}
+    # the borders, floor names and zone names, drawn once for the layout
+    STATICLAYERS = build_static_layers(mapObj, floor_name)
+    start_screen(mapObj) # show the title screen until the user presses a key
+    wait_for_logs(timeline) # until the log has a timestamp
+    if PRECOMPUTE_TIMELINE:
+        # every timestamp read so far becomes a slice of one array per floor,
+        # the ones appended later are still built on demand
+        MAPCACHE = TimelineMaps(update_map, timeline.timestamps, timeline.snapshots,
+                                keyframe_interval=KEYFRAME_INTERVAL)
+
+    timestamp = timeline.timestamps[0] # first timestamp of shipments
+
+    # The main game loop
+    while True: # main game loop
+        # Run to actually show the zone map:
+        result = run_zone(mapObj_initial, floor_name, location_index, timeline, timestamp)
+
+        # the timeline may have grown or dropped timestamps meanwhile
+        ss_index = timeline.index(timestamp)
+        ss_length = len(timeline)
+        dropped = timestamp not in timeline.snapshots
+
+        if result == 'next':
+            # Go to the next level.
+            if not dropped:
+                ss_index += 1
+            if ss_index >= ss_length:
+                # If there are no more timestamp, go back to the first one.
+                ss_index = 0
+        elif result == 'back':
+            # Go to the previous level.
+            ss_index -= 1
+            if ss_index < 0:
+                # If there are no previous levels, go to the last one.
+                ss_index = ss_length-1
+        elif result == 'latest':
+            # New timestamps arrived while showing the last one, follow them.
+            ss_index = ss_length-1
+
+        elif result == 'reset':
+            start_screen(mapObj_initial)
+            pass # Do nothing. Loop re-calls run_zone() to reset the zone
+        timestamp = timeline.timestamps[ss_index]
+
+
+def init_graphics():
+    # Pygame, the fonts and the tile images, shared by the viewer and the
+    # headless export (zone_export.py)
     global FPSCLOCK
     global DISPLAYSURF
     global IMAGESDICT
     global TILEMAPPING
+    global TILEATLAS
     global BASICFONT
     global FLOORNAMEFONT
     global ZONENAMEFONT
+    global HUDFONT
+    global PATHTILES
 
     # Pygame initialization and basic set up of the global variables.
     pygame.init()
@@ -46,6 +156,7 @@ def main():
     BASICFONT = pygame.font.Font('freesansbold.ttf', 18)
     FLOORNAMEFONT = pygame.font.Font('freesansbold.ttf', 60)
     ZONENAMEFONT = pygame.font.Font('freesansbold.ttf', 90)
+    HUDFONT = pygame.font.Font('freesansbold.ttf', 12)
 
     # A global dict value that will contain all the Pygame
     # Surface objects returned by pygame.image.load().
@@ -62,15 +173,17 @@ def main():
                   'lots_3_batched': pygame.image.load('images5x8/5x8_lot_3_batched.png'),
                   'lots_4_batched': pygame.image.load('images5x8/5x8_lot_4_batched.png'),
                   'lots_5_batched': pygame.image.load('images5x8/5x8_lot_5_batched.png'),
-                  # 'path_L_U_D': pygame.image.load('path_1.png'),
-                  # 'path_L_D': pygame.image.load('path_2.png'),
-                  # 'path_R_D': pygame.image.load('path_3.png'),
-                  # 'path_L_U': pygame.image.load('path_4.png'),
-                  # 'path_R_U': pygame.image.load('path_5.png'),
-                  # 'path_R_U_D': pygame.image.load('path_6.png'),
-                  # 'path_L_R_D': pygame.image.load('path_7.png'),
-                  # 'path_L_R_U': pygame.image.load('path_8.png'),
-                  # 'path_L_R_U_D': pygame.image.load('path_9.png'),
+                  'path_L_U_D': pygame.image.load('images5x8/5x8_path_1.png'),
+                  'path_L_D': pygame.image.load('images5x8/5x8_path_2.png'),
+                  'path_R_D': pygame.image.load('images5x8/5x8_path_3.png'),
+                  'path_L_U': pygame.image.load('images5x8/5x8_path_4.png'),
+                  'path_R_U': pygame.image.load('images5x8/5x8_path_5.png'),
+                  'path_R_U_D': pygame.image.load('images5x8/5x8_path_6.png'),
+                  'path_L_R_D': pygame.image.load('images5x8/5x8_path_7.png'),
+                  'path_L_R_U': pygame.image.load('images5x8/5x8_path_8.png'),
+                  'path_L_R_U_D': pygame.image.load('images5x8/5x8_path_9.png'),
+                  'path_U_D': pygame.image.load('images5x8/5x8_path_10.png'),
+                  'path_L_R': pygame.image.load('images5x8/5x8_path_11.png'),
                  }
 
     # These dict values are global, and map the character that appears
@@ -89,70 +202,65 @@ def main():
                    '5': IMAGESDICT['lots_5_batched'],
                   }
 
-    # read the zone maps
-    zones_3F = read_zone_file('3F_zone_maps.txt')
-    zones_3FM = read_zone_file('3FM_zone_maps.txt')
-    floor_name = [zones_3F['floor_name'], zones_3FM['floor_name']]
-    # read the data of locations, including the aisle, bay values of a location
-    locations_df = {}
-    locations_df['3F'] = pd.read_csv('locations_3F.csv', index_col = 0)
-    locations_df['3FM'] = pd.read_csv('locations_3FM.csv', index_col = 0)
-    # read the time-dependent shipments changes
-    ss_logs = read_shipments_batchs_logs('shipments_batchs_logs.txt')
-        # key = timestamp
-        # values = {'ppid': [ ], 'sequence': [ , , ], 'batch': [ , , ]}
+    # The pixels of every tile in TILEMAPPING, indexed by the tile code of
+    # the zone maps, so draw_map() can compose a whole map at once.
+    TILEATLAS = build_tile_atlas(TILEMAPPING, BGCOLOR)
 
-    # currently, we show all picking zones in 3F & 3FM
-    mapObj = [zones_3F['map_obj'], zones_3FM['map_obj']]
-    mapObj_initial = copy.deepcopy(mapObj)
-    start_screen(mapObj) # show the title screen until the user presses a key
+    # The path tiles of the route overlay, by the connector names of
+    # zone_route.route_connectors(), drawn at the size of the map tiles
+    # with only the line left opaque
+    PATHTILES = {}
+    for name, image in IMAGESDICT.items():
+        if name.startswith('path_'):
+            image.set_colorkey(PATHCOLORKEY)
+            PATHTILES[name[len('path_'):]] = image
 
-    # timestamp
-    timestamps = sorted(list(ss_logs.keys()))
 
-    ss_index = 0 # first timestamp of shipments
-    ss_length = len(ss_logs)
+def read_layout():
+    # Read the zone maps of 3F & 3FM and the cell of every location id in
+    # them. Returns (floor_name, mapObj, location_index)
 
-    # The main game loop
-    while True: # main game loop
-        # Run to actually show the zone map:
-        timestamp = timestamps[ss_index]
-        ppid = ss_logs[timestamps[ss_index]]['ppid'] # the ppid
-        shipments = ss_logs[timestamps[ss_index]]['sequence'] # the list of shipments pending to be batched
-        batchs = ss_logs[timestamps[ss_index]]['batch']  # the list of shipments batched
-        
-        result = run_zone(mapObj_initial, floor_name, locations_df, timestamp, ppid, shipments, batchs, ss_length)
+    # read the zone maps
+    zones_3F = read_zone_file('3F_zone_maps.txt', 'locations_3F.csv', '3F_zone_layout.json')
+    zones_3FM = read_zone_file('3FM_zone_maps.txt', 'locations_3FM.csv', '3FM_zone_layout.json')
+    floor_name = [zones_3F['floor_name'], zones_3FM['floor_name']]
+    # the cell of every location id in the zone maps, built once
+    location_index = {}
+    location_index['3F'] = zones_3F['location_index']
+    location_index['3FM'] = zones_3FM['location_index']
 
-        if result == 'next':
-            # Go to the next level.
-            ss_index += 1
-            if ss_index >= ss_length:
-                # If there are no more timestamp, go back to the first one.
-                ss_index = 0
-        elif result == 'back':
-            # Go to the previous level.
-            ss_index -= 1
-            if ss_index < 0:
-                # If there are no previous levels, go to the last one.
-                ss_index = ss_length-1
+    mapObj = [zones_3F['map_obj'], zones_3FM['map_obj']]
+    return floor_name, mapObj, location_index
 
-        elif result == 'reset':
-            start_screen(mapObj_initial)
-            pass # Do nothing. Loop re-calls run_zone() to reset the zone
 
+def run_zone(mapObj_initial, floor_name, location_index, timeline, timestamp):
+    global SHOW_TIMINGS
+    global SHOW_ROUTES
 
-def run_zone(mapObj_initial, floor_name, locations_df, timestamp, ppid, shipments, batchs, ss_length):
-    # height of each mapObj
-    height_mapObj = [len(obj) for obj in mapObj_initial]
-    interval = 60 # the distance between 3F bottom and 3FM top
+    snapshot = timeline[timestamp]
+    ppid = snapshot['ppid'] # the ppid
+    shipments = snapshot['sequence'] # the list of shipments pending to be batched
+    batchs = snapshot['batch'] # the list of shipments batched
+    # the borders and floor names
+    staticLayer = STATICLAYERS['zone']
     # batchsize
     batchsize = len(batchs)
     mapNeedsRedraw = True
+    lastPoll = pygame.time.get_ticks()
+    snapshotCounted = METRICS is None
 
     while True: # main game loop
         # Reset these variables:
 
-        for event in pygame.event.get(): # event handling loop
+        # sleep until an event or the next look at the log, unless the map
+        # is still to be drawn
+        if mapNeedsRedraw:
+            timeout = 0
+        elif FOLLOW_LOGS:
+            timeout = max(0, LOGS_POLL_INTERVAL - (pygame.time.get_ticks() - lastPoll))
+        else:
+            timeout = None
+        for event in next_events(timeout): # event handling loop
             if event.type == QUIT:
                 terminate()
 
@@ -170,137 +278,245 @@ def run_zone(mapObj_initial, floor_name, locations_df, timestamp, ppid, shipment
                     return 'back'
                 elif event.key == K_r:
                     return 'reset' # Reset the zone map.
-
-        mapObj_3F, changed_3F = update_map(mapObj_initial[0], locations_df['3F'], shipments, batchs)
-        mapObj_3FM, changed_3FM = update_map(mapObj_initial[1], locations_df['3FM'], shipments, batchs)
+                elif event.key == K_t:
+                    SHOW_TIMINGS = not SHOW_TIMINGS # show or hide the timing HUD
+                    mapNeedsRedraw = True
+                elif event.key == K_p:
+                    SHOW_ROUTES = not SHOW_ROUTES # show or hide the routes of the batch
+                    mapNeedsRedraw = True
+
+        if FOLLOW_LOGS and pygame.time.get_ticks() - lastPoll >= LOGS_POLL_INTERVAL:
+            # Add the lines appended to the log since the last look
+            lastPoll = pygame.time.get_ticks()
+            latest = timeline.timestamps[-1]
+            updated = poll_logs(timeline)
+            if timestamp == latest and timeline.timestamps[-1] != latest:
+                return 'latest'
+            if timestamp in updated or timestamp not in timeline.snapshots:
+                return 'reload' # the shown snapshot was rewritten or dropped
+
+        # only rebuilt when the timestamp, layout or location table changes
+        updateStart = time.perf_counter()
+        mapObj_3F, changed_3F = MAPCACHE.get('3F', timestamp, mapObj_initial[0], location_index['3F'], shipments, batchs)
+        mapObj_3FM, changed_3FM = MAPCACHE.get('3FM', timestamp, mapObj_initial[1], location_index['3FM'], shipments, batchs)
+        if not snapshotCounted:
+            # with the lookups kept next to the maps
+            METRICS.snapshot(timestamp, ppid, shipments, len(batchs),
+                             [MAPCACHE.lookup(floor, timestamp) for floor in ('3F', '3FM')])
+            snapshotCounted = True
 
         if changed_3F or changed_3FM:
             mapNeedsRedraw = True
 
         if mapNeedsRedraw:
-            mapSurf_3F = draw_map(mapObj_3F)
-            mapSurf_3FM = draw_map(mapObj_3FM)
+            mapObj = [mapObj_3F, mapObj_3FM]
+            # the routes are only worked out again for a batch not seen yet
+            routes = batch_routes(mapObj_initial, batchs) if SHOW_ROUTES else [None, None]
+            TIMINGS.add('update', time.perf_counter() - updateStart)
             mapNeedsRedraw = False
 
-            DISPLAYSURF.fill(BGCOLOR)
-
-            # Adjust mapSurf's Rect object
-            mapSurfRect_3F = mapSurf_3F.get_rect()
-            mapSurfRect_3F.midtop = (HALF_WINWIDTH, 60)
-            mapSurfRect_3FM = mapSurf_3FM.get_rect()
-            mapSurfRect_3FM.midbottom = (HALF_WINWIDTH, WINHEIGHT - 10)
-            # Draw mapSurf to the DISPLAYSURF Surface object.
-            DISPLAYSURF.blit(mapSurf_3F, mapSurfRect_3F)
-            DISPLAYSURF.blit(mapSurf_3FM, mapSurfRect_3FM)
-
-            # Draw  floor name to the DISPLAYSURF Surface object
-            for i in range(len(floor_name)):
-                height = sum(height_mapObj[:i])
-                zoneSurf = BASICFONT.render('Floor: {} '.format(floor_name[i]), 1, TEXTCOLOR)
-                zoneRect = zoneSurf.get_rect()
-                zoneRect.topleft = (20,  10 + height*TILEHEIGHT + i * interval)
-                DISPLAYSURF.blit(zoneSurf, zoneRect)
-
-            draw_border_3FM(mapObj_initial[1])
-
-            stepSurf = BASICFONT.render('{}, PPID: {}, batchjobsize: {}'.format(timestamp, ppid, batchsize), 1, TEXTCOLOR)
-            stepRect = stepSurf.get_rect()
-            stepRect.topleft = (20, 30)
-            DISPLAYSURF.blit(stepSurf, stepRect)
-
-            pygame.display.update() # draw DISPLAYSURF to the screen
-        FPSCLOCK.tick()
-
-
-def update_map(mapObj_initial, locations_df, shipments, batchs):
+            routeLayers = []
+            for i in range(len(mapObj)):
+                if routes[i] is DISPLAYED['routes'][i]:
+                    routeLayers.append(DISPLAYED['routeLayers'][i])
+                elif routes[i]:
+                    routeLayers.append(draw_route_layer(routes[i], mapObj[i].shape, PATHTILES))
+                else:
+                    routeLayers.append(None)
+
+            if INCREMENTAL_REDRAW and same_layout(DISPLAYED['mapObj'], mapObj):
+                # Only repaint the tiles that differ from the maps on the screen
+                with TIMINGS.phase('draw'):
+                    dirtyRects = []
+                    tiles = 0
+                    for i in range(len(mapObj)):
+                        cells = changed_cells(DISPLAYED['mapObj'][i], mapObj[i])
+                        if routes[i] is not DISPLAYED['routes'][i]:
+                            # and the tiles under the old and the new route
+                            cells = np.union1d(cells, route_cells(DISPLAYED['routes'][i] or []))
+                            cells = np.union1d(cells, route_cells(routes[i] or []))
+                        dirtyRects += redraw_cells(DISPLAYSURF, mapObj[i], cells, TILEATLAS, DISPLAYED['topleft'][i])
+                        tiles += len(cells)
+
+                    # Draw the routes back over the repainted parts
+                    for i in range(len(mapObj)):
+                        if routeLayers[i] is None:
+                            continue
+                        routeRect = routeLayers[i].get_rect(topleft=DISPLAYED['topleft'][i])
+                        for rect in dirtyRects:
+                            rect = rect.clip(routeRect)
+                            if rect.width and rect.height:
+                                blit_layer(DISPLAYSURF, routeLayers[i], rect, rect.move(-routeRect.x, -routeRect.y))
+
+                    # Clear the previous timestamp, PPID, batchjobsize and timings
+                    for rect in [DISPLAYED['stepRect'], DISPLAYED['timingsRect']]:
+                        if rect is not None:
+                            DISPLAYSURF.fill(BGCOLOR, rect)
+                            dirtyRects.append(rect)
+
+                # Put the borders and floor names back over the repainted parts
+                with TIMINGS.phase('border'):
+                    for rect in dirtyRects:
+                        blit_layer(DISPLAYSURF, staticLayer, rect, rect)
+            else:
+                DISPLAYED['topleft'] = draw_zone(mapObj, routeLayers)
+                dirtyRects = None # the whole window
+                tiles = sum(obj.size for obj in mapObj)
+
+            with TIMINGS.phase('draw'):
+                stepRect = draw_step(timestamp, ppid, batchsize)
+            timingsRect = draw_timings(stepRect) if SHOW_TIMINGS else None
+            DISPLAYED['mapObj'] = mapObj
+            DISPLAYED['stepRect'] = stepRect
+            DISPLAYED['timingsRect'] = timingsRect
+            DISPLAYED['routes'] = routes
+            DISPLAYED['routeLayers'] = routeLayers
+
+            with TIMINGS.phase('display'):
+                if dirtyRects is None:
+                    pygame.display.update() # draw DISPLAYSURF to the screen
+                else:
+                    dirtyRects.append(stepRect)
+                    if timingsRect is not None:
+                        dirtyRects.append(timingsRect)
+                    pygame.display.update(dirtyRects) # only the changed parts
+            phases = TIMINGS.end_frame(tiles)
+            if METRICS is not None:
+                METRICS.frame(timestamp, phases, tiles)
+
+
+def draw_zone(mapObj, routeLayers=None):
+    # Draw the 3F & 3FM maps, with the route layer of each map when given,
+    # and their floor names and borders onto the whole DISPLAYSURF.
+    # Returns the topleft of each map.
+    # This function does not call pygame.display.update()
+    with TIMINGS.phase('draw'):
+        mapSurf_3F = draw_map(mapObj[0])
+        mapSurf_3FM = draw_map(mapObj[1])
+
+        DISPLAYSURF.fill(BGCOLOR)
+
+        # Adjust mapSurf's Rect object
+        mapSurfRect_3F = mapSurf_3F.get_rect()
+        mapSurfRect_3F.midtop = (HALF_WINWIDTH, 60)
+        mapSurfRect_3FM = mapSurf_3FM.get_rect()
+        mapSurfRect_3FM.midbottom = (HALF_WINWIDTH, WINHEIGHT - 10)
+        # Draw mapSurf to the DISPLAYSURF Surface object.
+        DISPLAYSURF.blit(mapSurf_3F, mapSurfRect_3F)
+        DISPLAYSURF.blit(mapSurf_3FM, mapSurfRect_3FM)
+        for routeLayer, mapSurfRect in zip(routeLayers or [], [mapSurfRect_3F, mapSurfRect_3FM]):
+            if routeLayer is not None:
+                blit_layer(DISPLAYSURF, routeLayer, mapSurfRect)
+
+    # Draw the floor names and borders in one blit
+    with TIMINGS.phase('border'):
+        blit_layer(DISPLAYSURF, STATICLAYERS['zone'])
+    return [mapSurfRect_3F.topleft, mapSurfRect_3FM.topleft]
+
+
+def draw_step(timestamp, ppid, batchsize):
+    # Draw the timestamp, PPID and batchjobsize line. Returns its Rect.
+    stepSurf = BASICFONT.render('{}, PPID: {}, batchjobsize: {}'.format(timestamp, ppid, batchsize), 1, TEXTCOLOR)
+    stepRect = stepSurf.get_rect()
+    stepRect.topleft = (20, 30)
+    DISPLAYSURF.blit(stepSurf, stepRect)
+    return stepRect
+
+
+def draw_timings(stepRect):
+    # Draw the timing HUD to the right of the PPID line: the last, mean and
+    # 95th percentile milliseconds of every phase of run_zone(), the frames
+    # per second and the tiles redrawn. Returns its Rect.
+    timingsSurf = HUDFONT.render(TIMINGS.summary(), 1, TEXTCOLOR)
+    timingsRect = timingsSurf.get_rect()
+    timingsRect.midleft = (stepRect.right + 20, stepRect.centery)
+    DISPLAYSURF.blit(timingsSurf, timingsRect)
+    return timingsRect
+
+
+def batch_routes(mapObj_initial, batchs):
+    # The path tiles of the route of the batch on 3F and on 3FM, see
+    # RouteCache. The distance tables are read the first time.
+    if not DISTANCES:
+        DISTANCES['3F'] = load_distance_table('3F_zone_maps.txt', 'locations_3F.csv', '3F_zone_layout.json')
+        DISTANCES['3FM'] = load_distance_table('3FM_zone_maps.txt', 'locations_3FM.csv', '3FM_zone_layout.json')
+    return [ROUTES.get('3F', mapObj_initial[0], DISTANCES['3F'], batchs),
+            ROUTES.get('3FM', mapObj_initial[1], DISTANCES['3FM'], batchs)]
+
+
+def same_layout(mapObj_before, mapObj_after):
+    # whether mapObj_after can be drawn over mapObj_before tile by tile
+    if mapObj_before is None or len(mapObj_before) != len(mapObj_after):
+        return False
+    return all(before.shape == after.shape for before, after in zip(mapObj_before, mapObj_after))
+
+
+def update_map(mapObj_initial, location_index, shipments, batchs):
     # update the shipments in the zone map
-    mapObj = copy.deepcopy(mapObj_initial)
 
     # e.g. 'sequence': [176653, 176062, 180793], 'batch': [176265, 175953, 175996, 176166]
     if shipments: # if there are shipments (ready to pick) in the zone map 
-        # update the map
-        for i in range(len(shipments)):
-            if shipments[i] in locations_df.index:
-                location = locations_df.loc[shipments[i]]
-                zone = location['zone']
-                aisle = location['aisle']
-                bay = location['bay']
-
-                y, x = location_xy(zone, aisle, bay)
-
-                if mapObj[x][y] == '#': # the (x, y) position is a 'lot'
-                    mapObj[x][y] = 'a'
-                elif mapObj[x][y] == 'a':
-                    mapObj[x][y] = 'b'
-                elif mapObj[x][y] == 'b':
-                    mapObj[x][y] = 'c'
-                elif mapObj[x][y] == 'c':
-                    mapObj[x][y] = 'd'
-                elif mapObj[x][y] == 'd':
-                    mapObj[x][y] = 'e'
-
-        if batchs: 
-            # update the batched shipments in the map
-            for i in range(len(batchs)):
-                if batchs[i] in locations_df.index:
-                    location = locations_df.loc[batchs[i]]
-                    zone = location['zone']
-                    aisle = location['aisle']
-                    bay = location['bay']
-
-                    y, x = location_xy(zone, aisle, bay)
-
-                    if mapObj[x][y] in ('#','a','b','c','d','e'):
-                        mapObj[x][y] = '1'
-                    elif mapObj[x][y] == '1':
-                        mapObj[x][y] = '2'
-                    elif mapObj[x][y] == '2':
-                        mapObj[x][y] = '3'
-                    elif mapObj[x][y] == '3':
-                        mapObj[x][y] = '4'
-                    elif mapObj[x][y] == '4':
-                        mapObj[x][y] = '5'
-
-        return mapObj, True # the map needs to redraw
-
-    return mapObj, False # the map doesn't need to redraw
-
-
-def read_zone_file(filename):
-    with open(filename, 'r') as f:
-        lines = f.readlines()
-
-    h = len(lines) #
-    w = len(lines[0].rstrip().split(' ')) #
-    # Convert maps to a 2-d array map object
-    map_obj = []
-    for x in range(h):
-        map_obj.append(lines[x].rstrip().split(' '))
+        # one lookup of the pending and batched shipments, its counts are
+        # kept with the map for the metrics, see ViewerMetrics.snapshot()
+        resolveStart = time.perf_counter()
+        cells, known = resolve_known_cells(location_index, shipments + batchs)
+        placed = cells != NOT_ON_FLOOR
+        lookup = {'looked_up': len(cells),
+                  'known': int(known.sum()),
+                  'placed': int(placed.sum()),
+                  'seconds': time.perf_counter() - resolveStart,
+                 }
+        # pending: lot -> a -> ... -> e, batched: any lot -> 1 -> ... -> 5
+        pending = placed[:len(shipments)]
+        mapObj = accumulate_levels(mapObj_initial,
+                                   cells[:len(shipments)][pending],
+                                   cells[len(shipments):][placed[len(shipments):]])
+        return mapObj, True, lookup # the map needs to redraw
+
+    return mapObj_initial.copy(), False # the map doesn't need to redraw
+
+
+def read_zone_file(filename, locations_filename, layout_filename):
+    # the zone map and the cell of every location id in it, from the
+    # compiled cache when it is up to date, see load_floor()
+    map_obj, location_index, _ = load_floor(filename, locations_filename, layout_filename)
+    h, w = map_obj.shape
 
     floor_name = filename.split('_')[0]
     zones = {'floor_name': floor_name,
              'height': h,
              'width': w,
              'map_obj': map_obj,
+             'location_index': location_index,
             }
     return zones
 
 
 def read_shipments_batchs_logs(filename):
-    ss_batchs = {}
+    # the whole log at once, key = timestamp, value = snapshot
+    return dict(iter_shipments_batchs_logs(filename))
 
-    with open(filename, 'r') as f:
-        lines = f.readlines()
 
-    for i in range(len(lines)):
-        line = lines[i].rstrip('\r\n').split(',')
-        batch_index = line.index(';')
-        ss_batchs[line[0]] = {'ppid': int(line[1]),
-                              'sequence': [int(x) for x in line[2: batch_index]],
-                              'batch': [int(x) for x in line[batch_index+1:]]
-                             }    
+def poll_logs(timeline):
+    # timeline.poll(), timed for the metrics
+    parseStart = time.perf_counter()
+    updated = timeline.poll()
+    if METRICS is not None:
+        METRICS.parsed(len(updated), time.perf_counter() - parseStart)
+    return updated
 
-    return ss_batchs
+
+def wait_for_logs(timeline):
+    # Keep polling the log until it has at least one timestamp
+    while not len(timeline):
+        if not FOLLOW_LOGS:
+            terminate() # nothing to show
+        for event in next_events(LOGS_POLL_INTERVAL):
+            if event.type == QUIT:
+                terminate()
+            elif event.type == KEYDOWN and event.key == K_ESCAPE:
+                terminate()
+        poll_logs(timeline)
 
 
 def draw_map(mapObj):
@@ -309,186 +525,16 @@ def draw_map(mapObj):
 
     # mapSurf will be the single Surface object that the tiles are drawn
     # on, so that it is easy to position the entire map on the DISPLAYSURF
-    # Surface object
-    map_h = len(mapObj)
-    map_w = len(mapObj[0])
-
-    mapSurfWidth = map_w * TILEWIDTH
-    mapSurfHeight = map_h * TILEHEIGHT
-    mapSurf = pygame.Surface((mapSurfWidth, mapSurfHeight))
-    mapSurf.fill(BGCOLOR) # start with a blank color on the surface
-
-    # Draw the tile sprites onto this surface
-    for h in range(map_h):
-        for w in range(map_w):
-            spaceRect = pygame.Rect((w * TILEWIDTH, h * TILEHEIGHT, TILEWIDTH, TILEHEIGHT))
-            if mapObj[h][w] in TILEMAPPING:
-                baseTile = TILEMAPPING[mapObj[h][w]]
-
-            # First draw the base ground/wall tile
-            mapSurf.blit(baseTile, spaceRect)
-
-    return mapSurf
-
-
-def location_xy(zone, aisle, bay):
-    # from the zone, aisle, bay to get the (x, y) position in the zone maps
-    # here only support the zones in DEO1 3FM 
-    # remeber to transpose the x, y values
-    tile_x = 0
-    tile_y = 0
-    if zone == 'A':
-        tile_x = aisle * 3 - 1
-        if bay <= 16:
-            tile_y = math.ceil(bay/2) - 1
-        elif bay <= 32:
-            tile_y = math.ceil(bay/2) 
-        elif bay <= 56:
-            tile_y = math.ceil(bay/2) + 2
-        else:
-            tile_y = math.ceil(bay/2) + 6
-    elif zone == 'AR':
-        tile_x = aisle * 2 + 11
-        tile_y = math.ceil(bay/2)      
-    elif zone == 'B':
-        if aisle == 0: # B0
-            tile_x = aisle * 3 + 23
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) - 1
-            elif bay <= 32:
-                tile_y = math.ceil(bay/2) 
-            elif bay <= 56:
-                tile_y = math.ceil(bay/2) + 2
-            else:
-                tile_y = math.ceil(bay/2) + 6
-        elif aisle == 1 or aisle == 2: # B1, B2
-            tile_x = aisle * 3 + 23
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle == 3: # B3
-            if bay%2 == 1:
-                tile_x = aisle * 3 + 23
-            else:
-                tile_x = aisle * 3 + 26
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle > 3 and aisle < 11: # B4 ~ B10
-            tile_x = aisle * 3 + 26
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle == 11: # B11
-            if bay%2 == 1:
-                tile_x = aisle * 3 + 26
-            else:
-                tile_x = aisle * 3 + 29
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle > 11 and aisle < 20: # B12 ~ B19
-            tile_x = aisle * 3 + 29
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle == 20: # B20
-            if bay%2 == 1:
-                tile_x = aisle * 3 + 29
-            else:
-                tile_x = aisle * 3 + 31
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-    elif zone == 'C':
-        tile_x = aisle * 3 + 94
-        if aisle < 18:
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) + 8
-            elif bay <= 40:
-                tile_y = math.ceil(bay/2) + 10
-            else:
-                tile_y = math.ceil(bay/2) + 14
-        elif aisle == 18:
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) - 1
-            elif bay <= 32:
-                tile_y = math.ceil(bay/2) 
-            elif bay <= 56:
-                tile_y = math.ceil(bay/2) + 2
-            else:
-                tile_y = math.ceil(bay/2) + 6 
-    elif zone == 'D':
-        tile_x = aisle * 3 + 151
-        if bay <= 16:
-            tile_y = math.ceil(bay/2) - 1
-        elif bay <= 32:
-            tile_y = math.ceil(bay/2) 
-        elif bay <= 56:
-            tile_y = math.ceil(bay/2) + 2
-        else:
-            tile_y = math.ceil(bay/2) + 6
-    elif zone == 'E':
-        tile_x = aisle * 3 + 178
-        if aisle == 0:
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) - 1
-            elif bay <= 32:
-                tile_y = math.ceil(bay/2) 
-            elif bay <= 56:
-                tile_y = math.ceil(bay/2) + 2
-            else:
-                tile_y = math.ceil(bay/2) + 6
-        elif aisle > 0:
-            if bay <= 16:
-                tile_y = math.ceil(bay/2) - 1
-            elif bay <= 32:
-                tile_y = math.ceil(bay/2) 
-            elif bay <= 52:
-                tile_y = math.ceil(bay/2) + 2
-            else:
-                tile_y = math.ceil(bay/2) + 10
-    elif zone == 'F':
-        tile_x = aisle * 3 + 208
-        if bay <= 16:
-            tile_y = math.ceil(bay/2) - 1
-        elif bay <= 32:
-            tile_y = math.ceil(bay/2) 
-        elif bay <= 52:
-            tile_y = math.ceil(bay/2) + 2
-        else:
-            tile_y = math.ceil(bay/2) + 10
-
-    if bay%2 == 1:
-        tile_x -= 1
-    else:
-        tile_x += 1
-
-    return tile_x, tile_y
+    # Surface object. The tile pixels of the whole map are assembled from
+    # TILEATLAS with array indexing and written to mapSurf in one call.
+    return draw_grid(mapObj, TILEATLAS)
 
 
 def start_screen(mapObj):
     # Display the start screen (which has the title and instructions)
     # until the player presses a key. Returns None
     # mapObj = [zones_3F['map_obj'], zones_3FM['map_obj']]
+    DISPLAYED['mapObj'] = None # the whole window is drawn over
 
     # Position the title image
     titleRect = IMAGESDICT['title'].get_rect()
@@ -510,8 +556,61 @@ def start_screen(mapObj):
         mapSurfRect.midbottom = (HALF_WINWIDTH, 60 + height*TILEHEIGHT + i * interval)
         # Draw mapSurf to the DISPLAYSURF Surface object
         DISPLAYSURF.blit(mapSurf, mapSurfRect)
-    
-    # Draw floorname to the DISPLAYSURF Surface object
+
+    # Draw the floor names, zone names and borders in one blit
+    blit_layer(DISPLAYSURF, STATICLAYERS['start'])
+
+    # Display the DISPLAYSURF contents to the actual screen.
+    pygame.display.update()
+
+    while True: # Main loop for the start screen.
+        for event in next_events(): # nothing changes until a key is pressed
+            if event.type == QUIT:
+                terminate()
+            elif event.type == KEYDOWN:
+                if event.key == K_ESCAPE:
+                    terminate()
+                return # user has pressed a key, so return.
+            elif event.type == VIDEOEXPOSE:
+                pygame.display.update() # the window was uncovered
+
+
+def build_static_layers(mapObj, floor_name):
+    # The borders, floor names and zone names never change while the layout
+    # stays the same, so they are drawn once onto transparent layers:
+    # 'start' for start_screen() and 'zone' for run_zone()
+    layers = {'start': build_start_layer(mapObj),
+              'zone': build_zone_layer(mapObj, floor_name),
+             }
+    return layers
+
+
+def build_zone_layer(mapObj, floor_name):
+    # the floor names and borders shown by run_zone()
+    layer = new_layer((WINWIDTH, WINHEIGHT))
+    height_mapObj = [len(obj) for obj in mapObj]
+    interval = 60 # the distance between 3F bottom and 3FM top
+
+    # Draw  floor name to the layer
+    for i in range(len(floor_name)):
+        height = sum(height_mapObj[:i])
+        zoneSurf = BASICFONT.render('Floor: {} '.format(floor_name[i]), 1, TEXTCOLOR)
+        zoneRect = zoneSurf.get_rect()
+        zoneRect.topleft = (20,  10 + height*TILEHEIGHT + i * interval)
+        blit_to_layer(layer, zoneSurf, zoneRect)
+
+    draw_border_3FM(layer, mapObj[1])
+    return layer
+
+
+def build_start_layer(mapObj):
+    # the floor names, zone names and borders shown by start_screen()
+    layer = new_layer((WINWIDTH, WINHEIGHT))
+    height_mapObj = [len(obj) for obj in mapObj]
+    width_mapObj = [len(obj[0]) for obj in mapObj]
+    interval = 60 # the distance between 3F bottom and 3FM top
+
+    # Draw floorname to the layer
     floornames = ['3F', '3.5F']
     floor_topleft_xy = {'3F': (20,  10),
                         '3.5F': (20, 10 + height_mapObj[0]*TILEHEIGHT + interval)}
@@ -519,9 +618,9 @@ def start_screen(mapObj):
         floor_surf = FLOORNAMEFONT.render('Floor: {} '.format(floorname), 1, (255, 0, 255))
         floor_rect =floor_surf.get_rect()
         floor_rect.topleft = floor_topleft_xy[floorname]
-        DISPLAYSURF.blit(floor_surf, floor_rect)
+        blit_to_layer(layer, floor_surf, floor_rect)
 
-    # Draw zonename to the DISPLAYSURF Surface object
+    # Draw zonename to the layer
     zonenames = ['A', 'AR', 'B', 'C', 'D', 'E', 'F',]  # zones in 3FM
                #  'G', 'H', 'I', 'J', 'K', 'L', 'LR']  # zones in 3F
     zone_center_xy = {'A': ((WINWIDTH-width_mapObj[1]*TILEWIDTH)/2 + 11*TILEWIDTH, 
@@ -542,27 +641,15 @@ def start_screen(mapObj):
         zone_surf = ZONENAMEFONT.render(zonenames[i], 1, TEXTCOLOR)
         zone_rect = zone_surf.get_rect()
         zone_rect.center = zone_center_xy[zonenames[i]]
-        DISPLAYSURF.blit(zone_surf, zone_rect)
-
-    # Draw borders of zone to the DISPLAYSURF Surface object
-    draw_border_3F(mapObj[0])
-    draw_border_3FM(mapObj[1])
-    
-    while True: # Main loop for the start screen.
-        for event in pygame.event.get():
-            if event.type == QUIT:
-                terminate()
-            elif event.type == KEYDOWN:
-                if event.key == K_ESCAPE:
-                    terminate()
-                return # user has pressed a key, so return.
+        blit_to_layer(layer, zone_surf, zone_rect)
 
-        # Display the DISPLAYSURF contents to the actual screen.
-        pygame.display.update()
-        FPSCLOCK.tick()
+    # Draw borders of zone to the layer
+    draw_border_3F(layer, mapObj[0])
+    draw_border_3FM(layer, mapObj[1])
+    return layer
 
-def draw_border_3F(mapObj):
-    # draw the border of zones onto the DISPLAYSURF
+def draw_border_3F(surf, mapObj):
+    # draw the border of zones onto surf
     map_h = len(mapObj)
     map_w = len(mapObj[0])
 
@@ -590,13 +677,13 @@ def draw_border_3F(mapObj):
     F_bottomleft = left_blank + 207 * TILEWIDTH, WINHEIGHT - 10
     F_bottomright = left_blank + 237 * TILEWIDTH, WINHEIGHT - 10
 
-    pygame.draw.line(DISPLAYSURF, BLUE, G_topleft, G_topright)
-    pygame.draw.line(DISPLAYSURF, BLUE, G_topleft, G_bottomleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, G_topright, G_top2right)
-    pygame.draw.line(DISPLAYSURF, BLUE, G_top2right, I_topright)
-    pygame.draw.line(DISPLAYSURF, BLUE, H_topleft, H_bottomleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, H_topright, H_bottomright)
-    pygame.draw.line(DISPLAYSURF, BLUE, G_bottomleft, I_bottomright)
+    pygame.draw.line(surf, BLUE, G_topleft, G_topright)
+    pygame.draw.line(surf, BLUE, G_topleft, G_bottomleft)
+    pygame.draw.line(surf, BLUE, G_topright, G_top2right)
+    pygame.draw.line(surf, BLUE, G_top2right, I_topright)
+    pygame.draw.line(surf, BLUE, H_topleft, H_bottomleft)
+    pygame.draw.line(surf, BLUE, H_topright, H_bottomright)
+    pygame.draw.line(surf, BLUE, G_bottomleft, I_bottomright)
     # pygame.draw.line(DISPLAYSURF, BLUE, C_topleft, C_bottomleft)
     # pygame.draw.line(DISPLAYSURF, BLUE, C_bottomleft, C_bottomright)
     # pygame.draw.line(DISPLAYSURF, BLUE, C_topright, C_bottomright)
@@ -608,8 +695,8 @@ def draw_border_3F(mapObj):
     # pygame.draw.line(DISPLAYSURF, BLUE, F_bottomleft, F_bottomright)
     # pygame.draw.line(DISPLAYSURF, BLUE, F_topright, F_bottomright)
 
-def draw_border_3FM(mapObj):
-    # draw the border of zones onto the DISPLAYSURF
+def draw_border_3FM(surf, mapObj):
+    # draw the border of zones onto surf
     map_h = len(mapObj)
     map_w = len(mapObj[0])
 
@@ -641,29 +728,41 @@ def draw_border_3FM(mapObj):
     F_bottomleft = left_blank + 207 * TILEWIDTH, WINHEIGHT - 10
     F_bottomright = left_blank + 237 * TILEWIDTH, WINHEIGHT - 10
 
-    pygame.draw.line(DISPLAYSURF, BLUE, A_topleft, AR_topleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, A_topleft, A_bottomleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, A_bottomleft, B_bottomleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, AR_topleft, AR_topright)
-    pygame.draw.line(DISPLAYSURF, BLUE, AR_topleft, AR_bottomleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, AR_bottomleft, B_topleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, AR_topright, AR_bottomright)
-    pygame.draw.line(DISPLAYSURF, BLUE, B_topleft, B_topright)
-    pygame.draw.line(DISPLAYSURF, BLUE, B_topleft, B_bottomleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, B_bottomleft, B_bottomright)
-    pygame.draw.line(DISPLAYSURF, BLUE, C_topleft, C_topright)
-    pygame.draw.line(DISPLAYSURF, BLUE, C_topleft, C_bottomleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, C_bottomleft, C_bottomright)
-    pygame.draw.line(DISPLAYSURF, BLUE, C_topright, C_bottomright)
-    pygame.draw.line(DISPLAYSURF, BLUE, D_topleft, C_topright)
-    pygame.draw.line(DISPLAYSURF, BLUE, D_topleft, F_topright)
-    pygame.draw.line(DISPLAYSURF, BLUE, D_topright, D_bottomright)
-    pygame.draw.line(DISPLAYSURF, BLUE, D_bottomleft, F_bottomright)
-    pygame.draw.line(DISPLAYSURF, BLUE, F_topleft, F_bottomleft)
-    pygame.draw.line(DISPLAYSURF, BLUE, F_bottomleft, F_bottomright)
-    pygame.draw.line(DISPLAYSURF, BLUE, F_topright, F_bottomright)
+    pygame.draw.line(surf, BLUE, A_topleft, AR_topleft)
+    pygame.draw.line(surf, BLUE, A_topleft, A_bottomleft)
+    pygame.draw.line(surf, BLUE, A_bottomleft, B_bottomleft)
+    pygame.draw.line(surf, BLUE, AR_topleft, AR_topright)
+    pygame.draw.line(surf, BLUE, AR_topleft, AR_bottomleft)
+    pygame.draw.line(surf, BLUE, AR_bottomleft, B_topleft)
+    pygame.draw.line(surf, BLUE, AR_topright, AR_bottomright)
+    pygame.draw.line(surf, BLUE, B_topleft, B_topright)
+    pygame.draw.line(surf, BLUE, B_topleft, B_bottomleft)
+    pygame.draw.line(surf, BLUE, B_bottomleft, B_bottomright)
+    pygame.draw.line(surf, BLUE, C_topleft, C_topright)
+    pygame.draw.line(surf, BLUE, C_topleft, C_bottomleft)
+    pygame.draw.line(surf, BLUE, C_bottomleft, C_bottomright)
+    pygame.draw.line(surf, BLUE, C_topright, C_bottomright)
+    pygame.draw.line(surf, BLUE, D_topleft, C_topright)
+    pygame.draw.line(surf, BLUE, D_topleft, F_topright)
+    pygame.draw.line(surf, BLUE, D_topright, D_bottomright)
+    pygame.draw.line(surf, BLUE, D_bottomleft, F_bottomright)
+    pygame.draw.line(surf, BLUE, F_topleft, F_bottomleft)
+    pygame.draw.line(surf, BLUE, F_bottomleft, F_bottomright)
+    pygame.draw.line(surf, BLUE, F_topright, F_bottomright)
+
+def next_events(timeout=None):
+    # The events to handle next. With IDLE_WAIT the loop sleeps until an
+    # event arrives or timeout milliseconds passed (see wait_events()),
+    # otherwise it polls at FPS frames per second.
+    if IDLE_WAIT:
+        return wait_events(timeout)
+    FPSCLOCK.tick(FPS)
+    return pygame.event.get()
+
 
 def terminate():
+    if METRICS is not None:
+        METRICS.close()
     pygame.quit()
     sys.exit()
 
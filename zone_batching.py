@@ -0,0 +1,226 @@
+import collections
+import time
+
+import numpy as np
+
+# The cost of putting two picks in one batch, in bays walked: an aisle
+# apart costs AISLE_COST bays more, another zone or floor more than any
+# walk within one
+AISLE_COST = 10
+ZONE_COST = 10 ** 4
+FLOOR_COST = 10 ** 6
+
+
+def location_keys(floors_locations, location_ids):
+    # Where every location id of a pending list is, for the whole list at
+    # once, from the locations of load_floor() of each floor:
+    # keys = {'floor': the floor of each id, len(floors_locations) when on
+    #                  none of them,
+    #         'zone': a zone code unique across the floors, -1 when on none,
+    #         'aisle': , 'bay': , 0 when on none}
+    location_ids = np.asarray(location_ids, dtype=np.int64)
+    count = len(location_ids)
+    keys = {'floor': np.full(count, len(floors_locations), dtype=np.int32),
+            'zone': np.full(count, -1, dtype=np.int32),
+            'aisle': np.zeros(count, dtype=np.int32),
+            'bay': np.zeros(count, dtype=np.int32),
+           }
+    zone_offset = 0
+    for floor, locations in enumerate(floors_locations):
+        ids = locations['ids']
+        if len(ids):
+            pos = np.searchsorted(ids, location_ids)
+            pos[pos == len(ids)] = 0
+            found = (ids[pos] == location_ids) & (keys['floor'] == len(floors_locations))
+            pos = pos[found]
+            keys['floor'][found] = floor
+            keys['zone'][found] = locations['zone'][pos] + zone_offset
+            keys['aisle'][found] = locations['aisle'][pos]
+            keys['bay'][found] = locations['bay'][pos]
+        zone_offset += len(locations['zone_names'])
+    return keys
+
+
+def walking_order(keys):
+    # The positions of the pending picks in the order a picker walks the
+    # floors: floor by floor, zone by zone, aisle by aisle, down the even
+    # aisles and up the odd ones so that the end of an aisle is next to the
+    # start of the following one
+    bay = np.where(keys['aisle'] % 2 == 0, keys['bay'], -keys['bay'])
+    return np.lexsort((bay, keys['aisle'], keys['zone'], keys['floor']))
+
+
+def proximity_cost(keys, seed, candidates):
+    # The cost of batching each of the candidates with the seed, see
+    # AISLE_COST
+    cost = np.abs(keys['bay'][candidates] - keys['bay'][seed]).astype(np.int64)
+    cost += AISLE_COST * np.abs(keys['aisle'][candidates] - keys['aisle'][seed])
+    cost += np.where(keys['zone'][candidates] != keys['zone'][seed], ZONE_COST, 0)
+    cost += np.where(keys['floor'][candidates] != keys['floor'][seed], FLOOR_COST, 0)
+    return cost
+
+
+def seed_and_grow(keys, batch_size, max_batches=None):
+    # Batch a pending list with seed-and-grow clustering: the oldest pick
+    # still pending seeds a batch, which grows with the pending picks
+    # closest to the seed, see proximity_cost(), up to batch_size picks.
+    # The candidates are the picks around the seed along walking_order(),
+    # so forming a batch costs one slice and one delete of an array, not a
+    # pass over every pending pick.
+    # keys are the location_keys() of the pending list in order. Returns
+    # the positions of the picks of each batch in walking order, the first
+    # max_batches batches only when given.
+    count = len(keys['floor'])
+    if batch_size < 1:
+        raise ValueError('batch_size must be at least 1, not {}'.format(batch_size))
+    walk = walking_order(keys)
+    rank = np.empty(count, dtype=np.int64) # the place of every pick in walk
+    rank[walk] = np.arange(count)
+    remaining = np.arange(count) # the ranks still pending, sorted
+    batched = np.zeros(count, dtype=bool)
+    reach = 2 * batch_size # the candidates on each side of the seed
+
+    batches = []
+    seed = 0
+    while len(remaining) and (max_batches is None or len(batches) < max_batches):
+        while batched[seed]:
+            seed += 1
+        r = int(np.searchsorted(remaining, rank[seed]))
+        lo, hi = max(0, r - reach), min(len(remaining), r + reach + 1)
+        candidates = walk[remaining[lo:hi]]
+        cost = proximity_cost(keys, seed, candidates)
+        cost[r - lo] = -1 # the seed is in its batch, whatever shares its bay
+        take = np.sort(np.argsort(cost, kind='stable')[:batch_size])
+
+        batch = candidates[take]
+        batched[batch] = True
+        remaining = np.delete(remaining, lo + take)
+        batches.append(batch)
+    return batches
+
+
+def batch_spread(keys):
+    # How many different zones and aisles the picks of a batch are in, from
+    # their location_keys(). Returns (zones, aisles).
+    aisles = np.unique(np.stack([keys['floor'], keys['zone'], keys['aisle']], axis=1), axis=0)
+    zones = np.unique(aisles[:, :2], axis=0)
+    return len(zones), len(aisles)
+
+
+def batch_snapshots(ppid, sequence, batches):
+    # The snapshots, in the shape of the shipments log, of taking the
+    # batches off the pending sequence one after the other: the sequence
+    # still pending and the batch taken from it
+    sequence = np.asarray(sequence, dtype=np.int64)
+    pending = np.ones(len(sequence), dtype=bool)
+    for batch in batches:
+        yield {'ppid': ppid,
+               'sequence': sequence[pending].tolist(),
+               'batch': sequence[batch].tolist(),
+              }
+        pending[batch] = False
+
+
+class OnlineBatcher(object):
+    """Batches shipments as they arrive, the way a streaming batcher would.
+
+    The pending shipments wait in buckets per (floor, zone, aisle), oldest
+    first. At most max_open batches are open at once, one per zone: a new
+    shipment joins the open batch of its zone, or waits in its bucket. A
+    batch is opened with the oldest pending shipment as its seed and grows
+    from the bucket of the seed, then the aisles next to it, and closes
+    when it has batch_size shipments or has been open max_wait seconds.
+
+    update() costs time in proportion to the new shipments and the
+    shipments of the batches it opens, not to the whole backlog; the
+    seconds it took are kept in latency."""
+
+    def __init__(self, floors_locations, batch_size, max_wait, max_open=4):
+        if batch_size < 1:
+            raise ValueError('batch_size must be at least 1, not {}'.format(batch_size))
+        self.floors_locations = floors_locations
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_open = max_open
+        self.buckets = {}  # key = (floor, zone, aisle), value = deque of arrivals
+        self.aisles = collections.defaultdict(set) # key = (floor, zone), value = aisles with a bucket
+        self.shipments = {} # key = arrival, value = (location id, bucket), while pending
+        self.arrivals = collections.deque() # arrivals oldest first, some already batched
+        self.next_arrival = 0
+        self.open = {}     # key = (floor, zone), value = {'ids': [ , , ], 'opened': time}
+        self.latency = 0.0 # the seconds the last update() took
+
+    def __len__(self):
+        # the shipments pending, not in any batch yet
+        return len(self.shipments)
+
+    def update(self, now, location_ids):
+        # Fold the new location ids in at time now (seconds). Returns the
+        # batches closed by this update: {'ids': , 'opened': , 'closed': ,
+        # 'reason': 'size' or 'time'}
+        start = time.perf_counter()
+        closed = []
+        keys = location_keys(self.floors_locations, location_ids)
+        for i, location_id in enumerate(location_ids):
+            zone = (int(keys['floor'][i]), int(keys['zone'][i]))
+            batch = self.open.get(zone)
+            if batch is not None:
+                batch['ids'].append(location_id)
+                if len(batch['ids']) >= self.batch_size:
+                    closed.append(self.close(zone, now, 'size'))
+            else:
+                self.add_pending(location_id, zone + (int(keys['aisle'][i]),))
+
+        for zone, batch in list(self.open.items()):
+            if now - batch['opened'] >= self.max_wait:
+                closed.append(self.close(zone, now, 'time'))
+        closed += self.fill(now)
+        self.latency = time.perf_counter() - start
+        return closed
+
+    def add_pending(self, location_id, bucket):
+        arrival = self.next_arrival
+        self.next_arrival += 1
+        if bucket not in self.buckets:
+            self.buckets[bucket] = collections.deque()
+            self.aisles[bucket[:2]].add(bucket[2])
+        self.buckets[bucket].append(arrival)
+        self.shipments[arrival] = (location_id, bucket)
+        self.arrivals.append(arrival)
+
+    def take(self, bucket, count):
+        # The location ids of up to count of the oldest shipments of a bucket
+        queue = self.buckets[bucket]
+        ids = []
+        while queue and len(ids) < count:
+            ids.append(self.shipments.pop(queue.popleft())[0])
+        if not queue:
+            del self.buckets[bucket]
+            self.aisles[bucket[:2]].discard(bucket[2])
+        return ids
+
+    def fill(self, now):
+        # Open batches seeded by the oldest pending shipments while there is
+        # room for them. Returns the ones that filled up at once.
+        closed = []
+        while len(self.open) < self.max_open and self.shipments:
+            while self.arrivals[0] not in self.shipments:
+                self.arrivals.popleft() # batched by an earlier batch
+            bucket = self.shipments[self.arrivals[0]][1]
+            zone, aisle = bucket[:2], bucket[2]
+            # the seed is the oldest of its bucket, the bucket comes first
+            ids = self.take(bucket, self.batch_size)
+            for other in sorted(self.aisles[zone], key=lambda other: abs(other - aisle)):
+                if len(ids) >= self.batch_size:
+                    break
+                ids += self.take(zone + (other,), self.batch_size - len(ids))
+            self.open[zone] = {'ids': ids, 'opened': now}
+            if len(ids) >= self.batch_size:
+                closed.append(self.close(zone, now, 'size'))
+        return closed
+
+    def close(self, zone, now, reason):
+        batch = self.open.pop(zone)
+        batch['closed'] = now
+        batch['reason'] = reason
+        return batch
@@ -0,0 +1,216 @@
+"""Benchmarks of the zone viewer core, on the bundled 3F & 3FM data and on
+synthetic scaled-up inputs.
+
+    python zone_bench.py [--out zone_bench.json] [--filter text]
+                         [--compare old.json]
+
+Every stage is timed a few times and the min / median / mean seconds of
+one call are saved as JSON together with the commit and the machine, so
+runs of different commits on one machine can be compared with --compare.
+The synthetic inputs are 10x the locations, a 10^5 shipment snapshot, also
+batched with seed-and-grow, and a 10^4 timestamp log."""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+import pandas as pd
+import pygame
+
+import zone_3F_3FM as viewer
+from zone_cache import TimelineMaps
+from zone_batching import location_keys, seed_and_grow
+from zone_locations import build_location_index, compile_layout, read_layout_file, resolve_floor_cells
+from zone_logs import ShipmentsTimeline
+from zone_render import changed_cells, redraw_cells
+from zone_store import compile_floor, load_floor
+
+FLOORS = ['3F', '3FM']
+SCALE_LOCATIONS = 10 # times the bundled locations
+SNAPSHOT_LINES = 10 ** 5 # shipments in the big snapshot
+LOG_TIMESTAMPS = 10 ** 4 # timestamps in the synthetic log
+LOG_SHIPMENTS = 300 # pending shipments per synthetic timestamp
+LOG_BATCH = 20 # batched shipments per synthetic timestamp
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the stages of the zone viewer.')
+    parser.add_argument('--out', default='zone_bench.json', help='the JSON file to save the results to')
+    parser.add_argument('--filter', default='', help='only run the benchmarks whose name contains this')
+    parser.add_argument('--compare', help='a JSON file of an earlier run to compare with')
+    args = parser.parse_args(argv)
+
+    viewer.init_graphics()
+    results = {}
+    for name, func, repeat in benchmarks():
+        if args.filter not in name:
+            continue
+        results[name] = measure(func, repeat)
+        print('{:<40} {:>12}'.format(name, format_seconds(results[name]['median'])))
+
+    report = {'commit': git_commit(),
+              'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+              'machine': {'platform': platform.platform(),
+                          'processor': platform.processor() or platform.machine(),
+                          'cpus': os.cpu_count(),
+                          'python': platform.python_version(),
+                          'numpy': np.__version__,
+                          'pandas': pd.__version__,
+                          'pygame': pygame.version.ver,
+                         },
+              'results': results,
+             }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print('saved', args.out)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            compare(json.load(f), report)
+
+
+def measure(func, repeat):
+    # Seconds per call of func: timeit picks how many calls make one
+    # measurement (at least 0.2 s), the measurement is repeated
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {'min': min(times),
+            'median': float(np.median(times)),
+            'mean': float(np.mean(times)),
+            'number': number,
+            'repeat': repeat,
+           }
+
+
+def benchmarks():
+    # Yield (name, func, repeat) for every benchmark, building the inputs
+    # once up front
+    rng = np.random.default_rng(0)
+    floor_name, mapObj, location_index = viewer.read_layout()
+    ss_logs = viewer.read_shipments_batchs_logs('shipments_batchs_logs.txt')
+    timestamps = sorted(ss_logs)
+
+    # the bundled data
+    floors_locations = []
+    for i, floor in enumerate(FLOORS):
+        files = ('{}_zone_maps.txt'.format(floor), 'locations_{}.csv'.format(floor), '{}_zone_layout.json'.format(floor))
+        locations_df = pd.read_csv(files[1], index_col = 0)
+        layout = read_layout_file(files[2])
+        tables = compile_layout(layout, *mapObj[i].shape)
+        snapshot = ss_logs[timestamps[-1]]
+        before = viewer.update_map(mapObj[i], location_index[floor], ss_logs[timestamps[0]]['sequence'], ss_logs[timestamps[0]]['batch'])[0]
+        after = viewer.update_map(mapObj[i], location_index[floor], snapshot['sequence'], snapshot['batch'])[0]
+        surface = viewer.draw_map(before)
+        floors_locations.append(load_floor(*files)[2])
+
+        yield ('read_zone_file.cold.' + floor, lambda files=files: compile_floor(*files), 5)
+        yield ('read_zone_file.warm.' + floor, lambda files=files: viewer.read_zone_file(*files), 5)
+        yield ('compile_layout.' + floor, lambda layout=layout, shape=mapObj[i].shape: compile_layout(layout, *shape), 5)
+        yield ('build_location_index.' + floor, lambda df=locations_df, tables=tables: build_location_index(df, tables), 5)
+        yield ('update_map.' + floor, lambda grid=mapObj[i], index=location_index[floor], s=snapshot:
+               viewer.update_map(grid, index, s['sequence'], s['batch']), 5)
+        yield ('draw_map.' + floor, lambda grid=after: viewer.draw_map(grid), 5)
+        yield ('redraw_cells.' + floor, lambda surface=surface, before=before, after=after:
+               redraw_cells(surface, after, changed_cells(before, after), viewer.TILEATLAS, (0, 0)), 5)
+    yield ('read_shipments_batchs_logs', lambda: viewer.read_shipments_batchs_logs('shipments_batchs_logs.txt'), 5)
+
+    # 10x the locations of 3FM, the copies with new location ids
+    locations_df = pd.read_csv('locations_3FM.csv', index_col = 0)
+    step = int(locations_df.index.max()) + 1
+    big_df = pd.concat([locations_df.set_axis(locations_df.index + k * step) for k in range(SCALE_LOCATIONS)])
+    tables = compile_layout(read_layout_file('3FM_zone_layout.json'), *mapObj[1].shape)
+    big_index = build_location_index(big_df, tables)
+    yield ('build_location_index.3FMx{}'.format(SCALE_LOCATIONS), lambda: build_location_index(big_df, tables), 3)
+
+    # a snapshot of 10^5 shipments on the 10x locations
+    shipments = rng.choice(big_index['ids'], SNAPSHOT_LINES).tolist()
+    batchs = shipments[:SNAPSHOT_LINES // 10]
+    yield ('resolve_floor_cells.{}'.format(SNAPSHOT_LINES), lambda: resolve_floor_cells(big_index, shipments), 5)
+    yield ('update_map.3FM.{}'.format(SNAPSHOT_LINES), lambda: viewer.update_map(mapObj[1], big_index, shipments, batchs), 5)
+
+    # batching 10^5 pending shipments of the bundled locations
+    pending = rng.choice(np.concatenate([locations['ids'] for locations in floors_locations]), SNAPSHOT_LINES)
+    yield ('seed_and_grow.{}'.format(SNAPSHOT_LINES), lambda: seed_and_grow(location_keys(floors_locations, pending), LOG_BATCH), 3)
+
+    # a log of 10^4 timestamps
+    directory = tempfile.mkdtemp()
+    try:
+        log_filename = os.path.join(directory, 'shipments_batchs_logs.txt')
+        write_synthetic_log(log_filename, rng, np.concatenate([location_index[floor]['ids'] for floor in FLOORS]))
+        snapshots = viewer.read_shipments_batchs_logs(log_filename)
+        log_timestamps = sorted(snapshots)
+
+        yield ('read_shipments_batchs_logs.{}'.format(LOG_TIMESTAMPS), lambda: viewer.read_shipments_batchs_logs(log_filename), 3)
+        yield ('ShipmentsTimeline.poll.{}'.format(LOG_TIMESTAMPS), lambda: ShipmentsTimeline(log_filename, follow=False).poll(), 3)
+        for keyframe_interval in [None, 64]:
+            kind = 'delta' if keyframe_interval else 'dense'
+            maps = TimelineMaps(viewer.update_map, log_timestamps, snapshots, keyframe_interval=keyframe_interval)
+            build = lambda maps=maps: maps.build('3F', mapObj[0], location_index['3F'])
+            build()
+            positions = iter(np.tile(np.arange(len(log_timestamps)), 1000))
+            yield ('TimelineMaps.build.{}.{}'.format(kind, LOG_TIMESTAMPS), build, 1)
+            yield ('TimelineMaps.next.{}.{}'.format(kind, LOG_TIMESTAMPS), lambda maps=maps, positions=positions:
+                   maps.maps['3F'][next(positions)], 5)
+            jumps = iter(rng.integers(0, len(log_timestamps), 10 ** 7))
+            yield ('TimelineMaps.jump.{}.{}'.format(kind, LOG_TIMESTAMPS), lambda maps=maps, jumps=jumps:
+                   maps.maps['3F'][next(jumps)], 5)
+    finally:
+        shutil.rmtree(directory)
+
+
+def write_synthetic_log(filename, rng, location_ids):
+    # A shipments log whose pending shipments drift a few at a time, like
+    # consecutive lines of the real one
+    pending = rng.choice(location_ids, LOG_SHIPMENTS)
+    start = time.mktime((2018, 4, 21, 10, 0, 0, 0, 0, -1))
+    with open(filename, 'w') as f:
+        for t in range(LOG_TIMESTAMPS):
+            pending[rng.integers(0, LOG_SHIPMENTS, 5)] = rng.choice(location_ids, 5)
+            batch = rng.choice(pending, LOG_BATCH)
+            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start + 60 * t))
+            f.write('{},{},{},;,{}\n'.format(timestamp, 123456, ','.join(map(str, pending)), ','.join(map(str, batch))))
+
+
+def compare(old, new):
+    # Print how the medians of two runs compare
+    print('\ncompared with {} ({})'.format(old.get('commit'), old.get('date')))
+    print('{:<40} {:>12} {:>12} {:>8}'.format('benchmark', 'before', 'after', 'ratio'))
+    for name in sorted(new['results']):
+        if name not in old['results']:
+            continue
+        before = old['results'][name]['median']
+        after = new['results'][name]['median']
+        print('{:<40} {:>12} {:>12} {:>7.2f}x'.format(name, format_seconds(before), format_seconds(after), after / before))
+
+
+def format_seconds(seconds):
+    for unit, scale in [('s', 1), ('ms', 1e-3), ('us', 1e-6)]:
+        if seconds >= scale:
+            return '{:.3f} {}'.format(seconds / scale, unit)
+    return '{:.1f} ns'.format(seconds / 1e-9)
+
+
+def git_commit():
+    # the commit benchmarked, None outside of a git checkout
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                         cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.decode().strip()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
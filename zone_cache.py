@@ -0,0 +1,289 @@
+import tempfile
+
+import numpy as np
+
+
+class ZoneMapCache(object):
+    """Per-timestamp cache of the updated zone maps.
+
+    update_map() is only called the first time a (floor, timestamp) pair is
+    asked for. The cached maps are dropped when the layout or the location
+    table of a floor changes, or when invalidate() is called explicitly.
+    What the lookup of a map counted, when update_map() returns it, is kept
+    with the map, see lookup()."""
+
+    def __init__(self, update_func):
+        # update_func(mapObj_initial, location_index, shipments, batchs)
+        # returns (mapObj, changed), the same as update_map(), or
+        # (mapObj, changed, lookup) with the counts of its lookup
+        self.update_func = update_func
+        self.maps = {}     # key = (floor, timestamp), value = mapObj
+        self.lookups = {}  # key = (floor, timestamp), value = lookup or None
+        self.sources = {}  # key = floor, value = (mapObj_initial, location_index)
+
+    def get(self, floor, timestamp, mapObj_initial, location_index, shipments, batchs):
+        # returns (mapObj, changed), changed is True only when the map was
+        # (re)built by this call, so the caller knows it has to redraw
+        source = self.sources.get(floor)
+        if source is None or source[0] is not mapObj_initial or source[1] is not location_index:
+            # a new layout or location table for this floor
+            self.invalidate(floor)
+            self.sources[floor] = (mapObj_initial, location_index)
+
+        key = (floor, timestamp)
+        if key in self.maps:
+            return self.maps[key], False
+
+        mapObj, lookup = split_update(self.update_func(mapObj_initial, location_index, shipments, batchs))
+        self.maps[key] = mapObj
+        self.lookups[key] = lookup
+        return mapObj, True
+
+    def lookup(self, floor, timestamp):
+        # The counts of the lookup of the cached map of a (floor, timestamp),
+        # None when there are none
+        return self.lookups.get((floor, timestamp))
+
+    def invalidate(self, floor=None, timestamp=None):
+        # drop the cached maps of one floor and/or one timestamp,
+        # or everything when neither is given
+        for key in list(self.maps):
+            if floor is not None and key[0] != floor:
+                continue
+            if timestamp is not None and key[1] != timestamp:
+                continue
+            del self.maps[key]
+            self.lookups.pop(key, None)
+        if timestamp is None:
+            if floor is None:
+                self.sources.clear()
+            else:
+                self.sources.pop(floor, None)
+
+
+def split_update(result):
+    # (mapObj, lookup) of what an update_func returned, lookup None when it
+    # returned no counts
+    return result[0], (result[2] if len(result) > 2 else None)
+
+
+# Above this many bytes a floor's timeline is kept in a temporary file on
+# disk (memory-mapped) instead of in memory
+MEMMAP_BYTES = 64 * 1024 * 1024
+
+
+class TimelineMaps(object):
+    """The updated zone maps of every timestamp, worked out up front.
+
+    The first get() of a floor builds the maps of all the timestamps, after
+    that stepping, jumping or looping through the timeline only reads them
+    back. They are kept as DenseFrames, or as DeltaFrames when a
+    keyframe_interval is given. Timestamps added later (a log being
+    followed) fall back to a ZoneMapCache, a timestamp whose snapshot
+    changed is rebuilt in its slot the next time it is asked for. The
+    counts of the lookup of every map are kept next to it, as by
+    ZoneMapCache."""
+
+    def __init__(self, update_func, timestamps, snapshots, max_bytes=MEMMAP_BYTES, keyframe_interval=None):
+        # timestamps: the timestamps to precompute, snapshots: a dict,
+        # snapshots[timestamp] = {'sequence': shipments, 'batch': batchs}
+        # as in the shipments log
+        self.update_func = update_func
+        self.timestamps = list(timestamps)
+        self.snapshots = snapshots
+        self.max_bytes = max_bytes
+        self.keyframe_interval = keyframe_interval
+        self.slots = dict((timestamp, t) for t, timestamp in enumerate(self.timestamps))
+        self.maps = {}     # key = floor, value = DenseFrames or DeltaFrames
+        self.lookups = {}  # key = floor, value = the lookup of every slot
+        self.sources = {}  # key = floor, value = (mapObj_initial, location_index)
+        self.stale = {}    # key = floor, value = set of slots to rebuild
+        self.fallback = ZoneMapCache(update_func)
+
+    def get(self, floor, timestamp, mapObj_initial, location_index, shipments, batchs):
+        # returns (mapObj, changed) like ZoneMapCache.get(), changed is True
+        # when this call had to build something
+        if timestamp not in self.slots:
+            return self.fallback.get(floor, timestamp, mapObj_initial, location_index, shipments, batchs)
+
+        changed = False
+        source = self.sources.get(floor)
+        if source is None or source[0] is not mapObj_initial or source[1] is not location_index:
+            self.build(floor, mapObj_initial, location_index)
+            changed = True
+
+        t = self.slots[timestamp]
+        if t in self.stale[floor]:
+            self.maps[floor][t], self.lookups[floor][t] = split_update(
+                self.update_func(mapObj_initial, location_index, shipments, batchs))
+            self.stale[floor].discard(t)
+            changed = True
+        return self.maps[floor][t], changed
+
+    def build(self, floor, mapObj_initial, location_index):
+        # Work out the map of every timestamp of one floor
+        if self.keyframe_interval:
+            maps = DeltaFrames(mapObj_initial.shape, self.keyframe_interval)
+        else:
+            maps = DenseFrames(len(self.timestamps), mapObj_initial.shape, self.max_bytes)
+
+        lookups = [None] * len(self.timestamps)
+        stale = set()
+        for t, timestamp in enumerate(self.timestamps):
+            snapshot = self.snapshots.get(timestamp)
+            if snapshot is None:
+                stale.add(t) # dropped meanwhile
+                maps.append(mapObj_initial)
+                continue
+            mapObj, lookups[t] = split_update(
+                self.update_func(mapObj_initial, location_index, snapshot['sequence'], snapshot['batch']))
+            maps.append(mapObj)
+
+        self.maps[floor] = maps
+        self.lookups[floor] = lookups
+        self.sources[floor] = (mapObj_initial, location_index)
+        self.stale[floor] = stale
+
+    def lookup(self, floor, timestamp):
+        # The counts of the lookup of the map of a (floor, timestamp), see
+        # ZoneMapCache.lookup()
+        if timestamp not in self.slots:
+            return self.fallback.lookup(floor, timestamp)
+        t = self.slots[timestamp]
+        if floor not in self.lookups or t in self.stale[floor]:
+            return None
+        return self.lookups[floor][t]
+
+    def invalidate(self, floor=None, timestamp=None):
+        # the same as ZoneMapCache.invalidate(), a precomputed slot is only
+        # marked to be rebuilt
+        self.fallback.invalidate(floor, timestamp)
+        floors = list(self.maps) if floor is None else [floor]
+        if timestamp is None:
+            for name in floors:
+                self.maps.pop(name, None)
+                self.lookups.pop(name, None)
+                self.sources.pop(name, None)
+                self.stale.pop(name, None)
+        elif timestamp in self.slots:
+            for name in floors:
+                if name in self.stale:
+                    self.stale[name].add(self.slots[timestamp])
+
+
+class DenseFrames(object):
+    """Every map of a timeline in one (T, H, W) uint8 array, memory-mapped
+    to a temporary file when it is larger than max_bytes."""
+
+    def __init__(self, length, shape, max_bytes=MEMMAP_BYTES):
+        shape = (length,) + tuple(shape)
+        if np.prod(shape) > max_bytes:
+            self.frames = np.memmap(tempfile.TemporaryFile(), dtype=np.uint8, mode='w+', shape=shape)
+        else:
+            self.frames = np.empty(shape, dtype=np.uint8)
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, grid):
+        self.frames[self.length] = grid
+        self.length += 1
+
+    def __getitem__(self, t):
+        # a copy, so a slot rebuilt later doesn't change a map on the screen
+        return self.frames[t].copy()
+
+    def __setitem__(self, t, grid):
+        self.frames[t] = grid
+
+    @property
+    def nbytes(self):
+        return self.frames.nbytes
+
+
+class DeltaFrames(object):
+    """Every map of a timeline as a keyframe every keyframe_interval maps
+    plus the cells that change from one map to the next.
+
+    Consecutive snapshots share most of their shipments, so the memory
+    grows with the number of changed cells rather than with the floor area
+    times the number of timestamps. A map is rebuilt from the nearest
+    keyframe or from the map asked for last, stepping the deltas forward
+    or backward."""
+
+    def __init__(self, shape, keyframe_interval):
+        self.shape = tuple(shape)
+        self.keyframe_interval = keyframe_interval
+        self.keyframes = [] # the flat map of every keyframe_interval-th slot
+        self.deltas = []    # deltas[t] = (cells, codes before, codes after) from slot t-1 to t
+        self.cursor = None  # (slot, flat map) of the map asked for last
+        self.last = None    # the flat map of the last slot, for append()
+
+    def __len__(self):
+        return len(self.deltas)
+
+    def append(self, grid):
+        flat = np.array(grid, dtype=np.uint8).reshape(-1)
+        t = len(self.deltas)
+        if t % self.keyframe_interval == 0:
+            self.keyframes.append(flat.copy())
+        self.deltas.append(self.diff(self.last, flat))
+        self.last = flat
+
+    def __getitem__(self, t):
+        return self.flat(t).reshape(self.shape)
+
+    def __setitem__(self, t, grid):
+        # Replace the map of slot t, fixing the deltas on both sides of it
+        flat = np.array(grid, dtype=np.uint8).reshape(-1)
+        before = self.flat(t - 1) if t > 0 else None
+        after = self.flat(t + 1) if t + 1 < len(self.deltas) else None
+
+        if t % self.keyframe_interval == 0:
+            self.keyframes[t // self.keyframe_interval] = flat.copy()
+        self.deltas[t] = self.diff(before, flat)
+        if after is not None:
+            self.deltas[t + 1] = self.diff(flat, after)
+        if t == len(self.deltas) - 1:
+            self.last = flat
+        self.cursor = None
+
+    def flat(self, t):
+        # The flat map of slot t, starting from whichever of the cursor, the
+        # keyframe before t and the keyframe after t needs the fewest deltas
+        if t < 0 or t >= len(self.deltas):
+            raise IndexError('slot {} out of range'.format(t))
+        k = t // self.keyframe_interval
+        starts = [(t - k * self.keyframe_interval, k * self.keyframe_interval, None)]
+        if (k + 1) < len(self.keyframes):
+            starts.append(((k + 1) * self.keyframe_interval - t, (k + 1) * self.keyframe_interval, None))
+        if self.cursor is not None:
+            starts.append((abs(t - self.cursor[0]), self.cursor[0], self.cursor[1]))
+        _, start, flat = min(starts, key=lambda s: s[0])
+
+        if flat is None:
+            flat = self.keyframes[start // self.keyframe_interval]
+        flat = flat.copy()
+        for s in range(start + 1, t + 1): # forward
+            cells, _, codes = self.deltas[s]
+            flat[cells] = codes
+        for s in range(start, t, -1): # backward
+            cells, codes, _ = self.deltas[s]
+            flat[cells] = codes
+
+        self.cursor = (t, flat.copy())
+        return flat
+
+    def diff(self, flat_before, flat_after):
+        # (cells, codes before, codes after) between two flat maps
+        if flat_before is None:
+            return (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.uint8))
+        cells = np.flatnonzero(flat_before != flat_after).astype(np.int32)
+        return (cells, flat_before[cells], flat_after[cells])
+
+    @property
+    def nbytes(self):
+        # the memory held by the keyframes and the deltas
+        return (sum(frame.nbytes for frame in self.keyframes) +
+                sum(a.nbytes + b.nbytes + c.nbytes for a, b, c in self.deltas))
@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+
+from zone_grid import FLOOR
+from zone_locations import NOT_ON_FLOOR, resolve_cells
+from zone_store import load_floor, read_cache, source_stamp, write_cache
+
+UNREACHABLE = np.iinfo(np.uint16).max # the distance between nodes no walk joins
+NO_NODE = -1 # the node of a location id that is not on this floor
+# the bits set in every byte value, BYTE_BITS[byte, bit]
+BYTE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1, bitorder='little').astype(bool)
+
+
+def load_distance_table(zone_filename, locations_filename, layout_filename):
+    # The distance table of one floor, see build_distance_table(), from the
+    # cache next to the locations csv when it is up to date, see load_floor()
+    cache_filename = os.path.splitext(locations_filename)[0] + '_distances.npz'
+    sources = [zone_filename, locations_filename, layout_filename]
+
+    table = read_cache(cache_filename, sources)
+    if table is None:
+        stamps = dict((filename, source_stamp(filename)) for filename in sources)
+        grid, location_index, _ = load_floor(zone_filename, locations_filename, layout_filename)
+        table = build_distance_table(grid, location_index)
+        write_cache(cache_filename, stamps, table)
+    return table
+
+
+def build_distance_table(grid, location_index):
+    # The walking distance, in tiles, between every two pick faces of a
+    # floor. A pick face is picked from its access cell, the floor tile the
+    # picker stands on, and many locations share one: the walkway tile
+    # between two facing bays, the bays above each other. So the matrix is
+    # kept per access cell, the nodes, and every location id points at its
+    # node:
+    # table = {'ids': sorted location ids (location_index['ids']),
+    #          'nodes': the node of each id, NO_NODE when not on the floor,
+    #          'access': the flat cell of each node,
+    #          'width': the width of the grid, to turn access back into
+    #                   rows and columns,
+    #          'matrix': (nodes, nodes) uint16 distances, UNREACHABLE when
+    #                    no walk joins two nodes}
+    access = access_cells(grid)
+    cells = location_index['cells']
+    on_floor = cells != NOT_ON_FLOOR
+    location_access = np.full(len(cells), NOT_ON_FLOOR, dtype=np.int64)
+    location_access[on_floor] = access[cells[on_floor]]
+
+    reachable = location_access != NOT_ON_FLOOR
+    node_cells, nodes = np.unique(location_access[reachable], return_inverse=True)
+    location_nodes = np.full(len(cells), NO_NODE, dtype=np.int32)
+    location_nodes[reachable] = nodes
+
+    table = {'ids': location_index['ids'],
+             'nodes': location_nodes,
+             'access': node_cells.astype(np.int32),
+             'width': np.int32(grid.shape[1]),
+             'matrix': grid_distances(grid, node_cells),
+            }
+    return table
+
+
+def access_cells(grid):
+    # The flat cell a picker stands on to reach every cell of the grid:
+    # a floor tile is its own, a lot the floor tile next to it, left or
+    # right first as the walkways run along the bays, then above or below.
+    # A lot boxed in by other lots is reached from the nearest floor tile.
+    # NOT_ON_FLOOR when the grid has no floor at all.
+    height, width = grid.shape
+    walk = grid == FLOOR
+    flat = np.arange(height * width).reshape(height, width)
+    access = np.where(walk, flat, NOT_ON_FLOOR)
+
+    # grow the access cells of the floor into the lots one tile at a time
+    while True:
+        missing = access == NOT_ON_FLOOR
+        if not missing.any():
+            break
+        grown = access.copy()
+        for shifted in neighbours(access, NOT_ON_FLOOR):
+            take = (grown == NOT_ON_FLOOR) & (shifted != NOT_ON_FLOOR)
+            grown[take] = shifted[take]
+        if (grown == access).all():
+            break # nothing left to reach
+        access = grown
+    return access.reshape(-1)
+
+
+def neighbours(values, fill):
+    # The values of the right, left, lower and upper neighbour of every
+    # cell, in the order access_cells() prefers them
+    height, width = values.shape
+    right = np.full_like(values, fill)
+    right[:, :-1] = values[:, 1:]
+    left = np.full_like(values, fill)
+    left[:, 1:] = values[:, :-1]
+    below = np.full_like(values, fill)
+    below[:-1] = values[1:]
+    above = np.full_like(values, fill)
+    above[1:] = values[:-1]
+    return [right, left, below, above]
+
+
+def grid_distances(grid, node_cells):
+    # Breadth first search over the floor tiles from every node at once.
+    # Each tile holds one bit per node, packed into uint64 words, of the
+    # nodes that reached it; a step of the search moves the bits of the
+    # frontier to the four neighbours, for 64 nodes per word operation.
+    # Returns the (nodes, nodes) uint16 distances.
+    height, width = grid.shape
+    count = len(node_cells)
+    matrix = np.full((count, count), UNREACHABLE, dtype=np.uint16)
+    if count == 0:
+        return matrix
+    words = (count + 63) // 64
+    ys, xs = np.divmod(node_cells.astype(np.int64), width)
+
+    walk = np.where(grid == FLOOR, ~np.uint64(0), np.uint64(0))[:, :, None]
+    reached = np.zeros((height, width, words), dtype=np.uint64)
+    node = np.arange(count)
+    np.bitwise_or.at(reached, (ys, xs, node // 64), np.uint64(1) << (node % 64).astype(np.uint64))
+    frontier = reached.copy()
+    matrix[node, node] = 0
+
+    step = 0
+    spread = np.empty_like(reached)
+    while True:
+        step += 1
+        spread[:] = 0
+        spread[1:] |= frontier[:-1]
+        spread[:-1] |= frontier[1:]
+        spread[:, 1:] |= frontier[:, :-1]
+        spread[:, :-1] |= frontier[:, 1:]
+        spread &= walk
+        spread &= ~reached
+        if not spread.any():
+            break
+        reached |= spread
+        frontier, spread = spread, frontier
+
+        # the nodes whose bits arrived at other nodes this step: the words
+        # that changed, then their bytes, then the bits of those
+        arrived = frontier[ys, xs]
+        target, word = np.nonzero(arrived)
+        if len(target):
+            arrived = arrived[target, word].astype('<u8').view(np.uint8).reshape(-1, 8)
+            row, byte = np.nonzero(arrived)
+            found, bit = np.nonzero(BYTE_BITS[arrived[row, byte]])
+            row, byte = row[found], byte[found]
+            matrix[word[row] * 64 + byte * 8 + bit, target[row]] = step
+    return matrix
+
+
+def location_nodes(table, location_ids):
+    # The nodes of a list of location ids, NO_NODE for the ones that are not
+    # on this floor. Look them up once, then distance() is an array lookup.
+    cells = resolve_cells({'ids': table['ids'], 'cells': table['nodes']}, location_ids)
+    return np.where(cells == NOT_ON_FLOOR, NO_NODE, cells).astype(np.int32)
+
+
+def location_distance(table, location_a, location_b):
+    # The walking distance between two location ids, UNREACHABLE when they
+    # are not both on this floor
+    node_a, node_b = location_nodes(table, [location_a, location_b])
+    if node_a == NO_NODE or node_b == NO_NODE:
+        return int(UNREACHABLE)
+    return int(table['matrix'][node_a, node_b])
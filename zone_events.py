@@ -0,0 +1,17 @@
+import pygame
+
+
+def wait_events(timeout=None):
+    # The events that arrived, sleeping in pygame.event.wait() until there
+    # is one or until timeout milliseconds passed, so an idle window costs
+    # no CPU. timeout=None waits for as long as it takes, timeout=0 only
+    # takes the events already queued.
+    if timeout == 0:
+        return pygame.event.get()
+    if timeout is None:
+        event = pygame.event.wait()
+    else:
+        event = pygame.event.wait(int(timeout))
+    if event.type == pygame.NOEVENT:
+        return [] # timed out
+    return [event] + pygame.event.get()
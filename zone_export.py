@@ -0,0 +1,85 @@
+"""Headless export of the 3F & 3FM zone maps of every timestamp to PNG.
+
+    python zone_export.py [--logs shipments_batchs_logs.txt] [--out export]
+                          [--processes N]
+
+No display is needed, pygame runs on the SDL dummy video driver. The
+timestamps are spread over a multiprocessing pool, every worker renders
+with the zone maps and location index parsed once by the parent."""
+import argparse
+import os
+import sys
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import pygame
+
+import zone_3F_3FM as viewer
+from zone_store import SHARED, fork_pool, pool_chunksize
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render every timestamp of the shipments log to PNG.')
+    parser.add_argument('--logs', default='shipments_batchs_logs.txt', help='the shipments and batchs log')
+    parser.add_argument('--out', default='export', help='the directory to write the PNG files to')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+
+    # parse the layout and the log once, the workers get them from here
+    floor_name, mapObj, location_index = viewer.read_layout()
+    ss_logs = viewer.read_shipments_batchs_logs(args.logs)
+    timestamps = sorted(ss_logs.keys())
+
+    if not os.path.isdir(args.out):
+        os.makedirs(args.out)
+
+    tasks = []
+    for i, timestamp in enumerate(timestamps):
+        filename = os.path.join(args.out, '{:05d}_{}.png'.format(i, export_name(timestamp)))
+        snapshot = ss_logs[timestamp]
+        tasks.append((filename, timestamp, snapshot['ppid'], snapshot['sequence'], snapshot['batch']))
+
+    # load the graphics once here first: a missing tile image or font stops
+    # the export, a pool would start a new worker for every one that fails.
+    # The workers set pygame up again on their own, not on a forked copy.
+    viewer.init_graphics()
+    pygame.quit()
+
+    pool = fork_pool(args.processes, initializer=init_worker,
+                     floor_name=floor_name, mapObj=mapObj, location_index=location_index)
+    try:
+        chunksize = pool_chunksize(tasks, args.processes)
+        for filename in pool.imap_unordered(export_snapshot, tasks, chunksize):
+            print(filename)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def export_name(timestamp):
+    # '2018-04-21 10:00:00' -> '2018-04-21_10-00-00'
+    return timestamp.replace(' ', '_').replace(':', '-')
+
+
+def init_worker():
+    # Set up pygame and the viewer's graphics in a worker process, with the
+    # layout of SHARED
+    viewer.init_graphics()
+    viewer.STATICLAYERS = viewer.build_static_layers(SHARED['mapObj'], SHARED['floor_name'])
+
+
+def export_snapshot(task):
+    # Render one timestamp the same as run_zone() shows it and save it
+    filename, timestamp, ppid, shipments, batchs = task
+    mapObj = [viewer.update_map(SHARED['mapObj'][0], SHARED['location_index']['3F'], shipments, batchs)[0],
+              viewer.update_map(SHARED['mapObj'][1], SHARED['location_index']['3FM'], shipments, batchs)[0]]
+    viewer.draw_zone(mapObj)
+    viewer.draw_step(timestamp, ppid, len(batchs))
+    pygame.image.save(viewer.DISPLAYSURF, filename)
+    return filename
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,59 @@
+import numpy as np
+
+# Every tile of a zone map is stored as one uint8 code, the code of a symbol
+# is its position in SYMBOLS:
+#   '#' lot, '.' floor,
+#   'a' ~ 'e' lot with 1 ~ 5 shipments pending to be batched,
+#   '1' ~ '5' lot with 1 ~ 5 shipments batched
+SYMBOLS = '#.abcde12345'
+SYMBOL_CODES = dict((symbol, code) for code, symbol in enumerate(SYMBOLS))
+
+LOT = SYMBOL_CODES['#']
+FLOOR = SYMBOL_CODES['.']
+PENDING_LEVELS = np.array([SYMBOL_CODES[s] for s in 'abcde'], dtype=np.uint8)
+BATCHED_LEVELS = np.array([SYMBOL_CODES[s] for s in '12345'], dtype=np.uint8)
+
+def encode_map(map_obj):
+    # Convert a list of lists of one-character tiles into a 2-d uint8 grid
+    try:
+        rows = [[SYMBOL_CODES[symbol] for symbol in row] for row in map_obj]
+    except KeyError as e:
+        raise ValueError('unknown tile {} in the zone map'.format(e))
+    return np.array(rows, dtype=np.uint8)
+
+
+# How many shipments a tile already counts, indexed by its code.
+# -1 when the tile can't take that kind of shipment.
+PENDING_COUNT = np.full(len(SYMBOLS), -1, dtype=np.int32)
+PENDING_COUNT[LOT] = 0
+PENDING_COUNT[PENDING_LEVELS] = np.arange(1, len(PENDING_LEVELS) + 1)
+# a batched shipment resets the pending levels, so they count as 0
+BATCHED_COUNT = np.full(len(SYMBOLS), -1, dtype=np.int32)
+BATCHED_COUNT[LOT] = 0
+BATCHED_COUNT[PENDING_LEVELS] = 0
+BATCHED_COUNT[BATCHED_LEVELS] = np.arange(1, len(BATCHED_LEVELS) + 1)
+
+
+def accumulate_levels(grid_initial, pending_cells, batched_cells):
+    # Build the level grid of one snapshot in bulk: every pending shipment
+    # steps its lot one level up lot -> a -> ... -> e, then every batched
+    # shipment one level up lot, a ~ e -> 1 -> ... -> 5, duplicates counted
+    # twice and the levels saturating at 5.
+    flat = grid_initial.reshape(-1)
+    size = flat.size
+    pending = np.bincount(np.asarray(pending_cells, dtype=np.intp), minlength=size)
+    batched = np.bincount(np.asarray(batched_cells, dtype=np.intp), minlength=size)
+
+    grid = flat.copy()
+
+    count = PENDING_COUNT[grid]
+    hit = (count >= 0) & (pending > 0)
+    level = np.minimum(count[hit] + pending[hit], len(PENDING_LEVELS))
+    grid[hit] = PENDING_LEVELS[level - 1]
+
+    count = BATCHED_COUNT[grid]
+    hit = (count >= 0) & (batched > 0)
+    level = np.minimum(count[hit] + batched[hit], len(BATCHED_LEVELS))
+    grid[hit] = BATCHED_LEVELS[level - 1]
+
+    return grid.reshape(grid_initial.shape)
@@ -0,0 +1,121 @@
+import json
+
+import numpy as np
+
+NOT_ON_FLOOR = -1 # cell code of a location id that is not on this floor
+
+
+def read_layout_file(filename):
+    # Read the layout description of a floor, e.g. 3FM_zone_layout.json.
+    # layout = {'floor': floor name,
+    #           'zones': {zone: [run, run, ...]}}
+    # A run places the aisles aisles[0] ~ aisles[1] of a zone, all the same
+    # way, e.g. {"aisles": [0, 7], "x": [3, -1], "odd": -1, "even": 1,
+    #            "bays": [[1, 16, -1], [17, 32, 0], ...]}
+    #   x: the column of the walkway of an aisle is x[0] * aisle + x[1]
+    #   odd, even: the column of the odd / even bays next to the walkway
+    #   bays: [first bay, last bay, row offset], the row of a bay is
+    #         ceil(bay/2) + row offset, both sides of the walkway share a row
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def compile_layout(layout, height, width):
+    # Work out the cell of every (aisle, bay) of every zone once, into dense
+    # tables, so placing a location is an array lookup.
+    # tables = {'zones': {zone: {'first_aisle': the aisle of row 0,
+    #                            'cells': (aisles, last bay + 1) cells}},
+    #           'height': h, 'width': w}
+    # A position outside of the zone map is NOT_ON_FLOOR, and so is any
+    # (aisle, bay) no run covers.
+    zones = {}
+    for zone, runs in layout['zones'].items():
+        first_aisle = min(run['aisles'][0] for run in runs)
+        last_aisle = max(run['aisles'][1] for run in runs)
+        last_bay = max(band[1] for run in runs for band in run['bays'])
+        cells = np.full((last_aisle - first_aisle + 1, last_bay + 1), NOT_ON_FLOOR, dtype=np.int32)
+
+        for run in runs:
+            aisles = np.arange(run['aisles'][0], run['aisles'][1] + 1)
+            walkway = run['x'][0] * aisles + run['x'][1]
+            for first_bay, last_bay, row_offset in run['bays']:
+                bays = np.arange(first_bay, last_bay + 1)
+                side = np.where(bays % 2 == 1, run['odd'], run['even'])
+                tile_x = walkway[:, None] + side[None, :]
+                tile_y = np.broadcast_to((bays + 1) // 2 + row_offset, tile_x.shape)
+                inside = (tile_x >= 0) & (tile_x < width) & (tile_y >= 0) & (tile_y < height)
+                cells[np.ix_(aisles - first_aisle, bays)] = np.where(inside, tile_y * width + tile_x, NOT_ON_FLOOR)
+
+        zones[zone] = {'first_aisle': first_aisle, 'cells': cells}
+
+    tables = {'zones': zones,
+              'height': height,
+              'width': width,
+             }
+    return tables
+
+
+def locate_cells(tables, zone, aisle, bay):
+    # The cells of whole columns of zones, aisles and bays at once.
+    # Zones, aisles and bays missing from the layout get NOT_ON_FLOOR.
+    zone = np.asarray(zone)
+    aisle = np.asarray(aisle, dtype=np.int64)
+    bay = np.asarray(bay, dtype=np.int64)
+    cells = np.full(len(zone), NOT_ON_FLOOR, dtype=np.int32)
+
+    for name, table in tables['zones'].items():
+        rows = np.flatnonzero(zone == name)
+        i = aisle[rows] - table['first_aisle']
+        j = bay[rows]
+        known = (i >= 0) & (i < table['cells'].shape[0]) & (j >= 0) & (j < table['cells'].shape[1])
+        cells[rows[known]] = table['cells'][i[known], j[known]]
+    return cells
+
+
+def build_location_index(locations_df, tables):
+    # Convert every row of a locations csv into a flat cell number of the
+    # zone map (row * width + column), once at load time, with the tables
+    # of compile_layout().
+    # index = {'ids': sorted location ids, 'cells': the cell of each id,
+    #          'height': h, 'width': w}
+    ids = locations_df.index.to_numpy(dtype=np.int64)
+    cells = locate_cells(tables,
+                         locations_df['zone'].to_numpy(dtype=str),
+                         locations_df['aisle'].to_numpy(),
+                         locations_df['bay'].to_numpy())
+
+    order = np.argsort(ids, kind='stable')
+    index = {'ids': ids[order],
+             'cells': cells[order],
+             'height': tables['height'],
+             'width': tables['width'],
+            }
+    return index
+
+
+def resolve_cells(index, location_ids):
+    # Look up the cells of a whole list of location ids at once.
+    # Unknown ids get NOT_ON_FLOOR.
+    return resolve_known_cells(index, location_ids)[0]
+
+
+def resolve_known_cells(index, location_ids):
+    # resolve_cells(), also telling the ids of the locations csv apart from
+    # the unknown ones: both get NOT_ON_FLOOR, but only the ids in the csv
+    # are known, e.g. the ones in a zone the layout doesn't place.
+    # Returns (cells, known).
+    location_ids = np.asarray(location_ids, dtype=np.int64)
+    ids = index['ids']
+    if len(ids) == 0:
+        return np.full(len(location_ids), NOT_ON_FLOOR, dtype=np.int32), np.zeros(len(location_ids), dtype=bool)
+
+    pos = np.searchsorted(ids, location_ids)
+    pos[pos == len(ids)] = 0
+    found = ids[pos] == location_ids
+    return np.where(found, index['cells'][pos], NOT_ON_FLOOR).astype(np.int32), found
+
+
+def resolve_floor_cells(index, location_ids):
+    # The cells of the location ids that are on this floor
+    cells = resolve_cells(index, location_ids)
+    return cells[cells != NOT_ON_FLOOR]
@@ -0,0 +1,148 @@
+import bisect
+import os
+
+# A line of shipments_batchs_logs.txt:
+#   timestamp,ppid,shipment,shipment,...,;,shipment,shipment,...
+# the shipments before ';' are pending to be batched, the ones after it are
+# batched. A snapshot is {'ppid': ppid, 'sequence': [ , , ], 'batch': [ , , ]}
+
+
+def parse_log_line(line):
+    # Parse one line of the log. Returns (timestamp, snapshot)
+    line = line.rstrip('\r\n').split(',')
+    try:
+        batch_index = line.index(';')
+        snapshot = {'ppid': int(line[1]),
+                    'sequence': [int(x) for x in line[2: batch_index] if x],
+                    'batch': [int(x) for x in line[batch_index+1:] if x]
+                   }
+    except (ValueError, IndexError):
+        raise ValueError('malformed shipments log line: {!r}'.format(','.join(line)[:80]))
+    return line[0], snapshot
+
+
+def format_log_line(timestamp, snapshot):
+    # The line of the log for a snapshot, the reverse of parse_log_line()
+    return '{},{},{};{}\n'.format(timestamp, snapshot['ppid'],
+                                   ''.join('{},'.format(x) for x in snapshot['sequence']),
+                                   ''.join(',{}'.format(x) for x in snapshot['batch']))
+
+
+def follow_lines(filename, follow=True):
+    # Yield the lines of a text file one at a time, without reading
+    # the whole file into memory. When follow is True, keep watching the file
+    # after the end: a None is yielded whenever there is nothing new yet, so
+    # the caller can get on with other work and ask again later. The last
+    # line may still be being written: it is yielded without its newline
+    # when the end of the file is reached, and again once it grows.
+    # A file truncated or replaced (log rotation) is read again from the
+    # start.
+    f = open(filename, 'rb')
+    try:
+        partial = b''
+        yielded = b'' # the unfinished line yielded last
+        while True:
+            chunk = f.readline()
+            if chunk.endswith(b'\n'):
+                yield (partial + chunk).decode('utf-8')
+                partial = yielded = b''
+                continue
+            partial += chunk
+
+            if partial != yielded:
+                yield partial.decode('utf-8')
+                yielded = partial
+            if not follow:
+                return
+
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                stat = None # being rotated, try again later
+            if stat is not None and (stat.st_ino != os.fstat(f.fileno()).st_ino or stat.st_size < f.tell()):
+                f.close()
+                f = open(filename, 'rb')
+                partial = yielded = b''
+                continue
+            yield None
+    finally:
+        f.close()
+
+
+def iter_shipments_batchs_logs(filename, follow=False):
+    # Yield (timestamp, snapshot) for every line of the log as it is parsed.
+    # With follow=True the log is tailed and None is yielded while there are
+    # no new lines, see follow_lines(). The snapshot of an unfinished last
+    # line is yielded again when the line grows.
+    for line in follow_lines(filename, follow):
+        if line is None:
+            yield None
+        elif not line.strip():
+            continue
+        elif follow and not line.endswith('\n'):
+            try:
+                yield parse_log_line(line)
+            except ValueError:
+                pass # cut off before the ';', wait for the rest
+        else:
+            yield parse_log_line(line)
+
+
+class ShipmentsTimeline(object):
+    """The snapshots of a shipments log that is still being written.
+
+    poll() adds the lines appended since the last call, so the timeline grows
+    while the viewer runs. At most max_snapshots snapshots are kept, the
+    oldest timestamps are dropped first."""
+
+    def __init__(self, filename, follow=True, max_snapshots=None, on_change=None):
+        # on_change(timestamp) is called when the snapshot of a timestamp is
+        # replaced by a later line or dropped, e.g. to invalidate a cache
+        self.stream = iter_shipments_batchs_logs(filename, follow)
+        self.max_snapshots = max_snapshots
+        self.on_change = on_change
+        self.timestamps = [] # sorted
+        self.snapshots = {}  # key = timestamp, value = snapshot
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, timestamp):
+        return self.snapshots[timestamp]
+
+    def poll(self, max_lines=None):
+        # Read the lines available now, at most max_lines of them.
+        # Returns the timestamps that were added or replaced.
+        updated = []
+        for item in self.stream:
+            if item is None:
+                break # nothing more for now
+            timestamp, snapshot = item
+            if timestamp in self.snapshots:
+                self.changed(timestamp)
+            else:
+                bisect.insort(self.timestamps, timestamp)
+            self.snapshots[timestamp] = snapshot
+            updated.append(timestamp)
+            self.trim()
+            if max_lines is not None and len(updated) >= max_lines:
+                break
+        return updated
+
+    def trim(self):
+        # Drop the oldest snapshots over max_snapshots
+        if self.max_snapshots is None:
+            return
+        while len(self.timestamps) > self.max_snapshots:
+            timestamp = self.timestamps.pop(0)
+            del self.snapshots[timestamp]
+            self.changed(timestamp)
+
+    def changed(self, timestamp):
+        if self.on_change is not None:
+            self.on_change(timestamp)
+
+    def index(self, timestamp):
+        # The position of timestamp, or of the timestamp after it when it was
+        # dropped, clamped to the last one
+        return min(bisect.bisect_left(self.timestamps, timestamp), len(self.timestamps) - 1)
@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# name: (type, help) of every metric, in the order they are exported
+METRIC_TYPES = [('log_lines_total', 'counter', 'Lines of the shipments log parsed'),
+                ('parse_seconds_total', 'counter', 'Seconds spent parsing the shipments log'),
+                ('snapshots_total', 'counter', 'Snapshots shown'),
+                ('resolve_seconds_total', 'counter', 'Seconds the snapshots shown took to resolve to cells'),
+                ('shipments_resolved_total', 'counter', 'Shipments of the snapshots shown placed on a zone map'),
+                ('shipments_off_map_total', 'counter',
+                 'Shipments of the snapshots shown in a locations csv but placed on no zone map'),
+                ('shipments_unmapped_total', 'counter', 'Shipments of the snapshots shown not in any locations csv'),
+                ('frames_total', 'counter', 'Frames drawn'),
+                ('render_seconds_total', 'counter', 'Seconds spent drawing and displaying frames'),
+                ('tiles_redrawn_total', 'counter', 'Tiles redrawn'),
+                ('batch_size', 'gauge', 'Batched shipments of the snapshot shown'),
+                ('shipments_pending', 'gauge', 'Shipments pending to be batched in the snapshot shown'),
+                ('frame_render_seconds', 'gauge', 'Seconds to draw and display the last frame'),
+               ]
+PREFIX = 'zone_viewer_'
+
+
+class ViewerMetrics(object):
+    """Counters of the viewer's work, exported for the ops dashboards.
+
+    The viewer adds to the counters as it parses, resolves and draws, which
+    costs a dict update. Every snapshot shown and every frame drawn is also
+    appended to filename as one JSON object per line, when a filename is
+    given; serve() exports the counters in the Prometheus text format.
+
+    The shipments of a snapshot are counted when it is shown, from the
+    lookups that placed them on the maps of the floors, see snapshot()."""
+
+    def __init__(self, filename=None):
+        self.values = dict((name, 0) for name, _, _ in METRIC_TYPES)
+        self.lock = threading.Lock() # the http server reads from another thread
+        self.file = open(filename, 'a', buffering=1) if filename else None # line buffered
+        self.server = None
+
+    def add(self, **values):
+        # Add to counters / set gauges, e.g. add(frames_total=1)
+        with self.lock:
+            for name, value in values.items():
+                if name.endswith('_total'):
+                    self.values[name] += value
+                else:
+                    self.values[name] = value
+
+    def record(self, kind, **fields):
+        # Append one JSON line {"time": , "kind": kind, ...fields}
+        if self.file is None:
+            return
+        record = {'time': round(time.time(), 3), 'kind': kind}
+        record.update(fields)
+        self.file.write(json.dumps(record) + '\n')
+
+    def parsed(self, lines, seconds):
+        self.add(log_lines_total=lines, parse_seconds_total=seconds)
+        if lines:
+            self.record('parse', lines=lines, parse_ms=round(seconds * 1000.0, 3))
+
+    def snapshot(self, timestamp, ppid, shipments, batch_size, lookups=()):
+        # A snapshot shown. lookups are the lookups of its ids on every floor,
+        # as update_map() returns them: {'looked_up': ids, 'known': of them in
+        # the locations csv of the floor, 'placed': of those on its map,
+        # 'seconds': }. They are counted when every floor has one; a
+        # location id is in one floor's csv at most, so the ids in none are
+        # the ones no floor knows.
+        self.add(snapshots_total=1, batch_size=batch_size, shipments_pending=len(shipments))
+        fields = {}
+        if lookups and all(lookup is not None for lookup in lookups):
+            known = sum(lookup['known'] for lookup in lookups)
+            placed = sum(lookup['placed'] for lookup in lookups)
+            seconds = sum(lookup['seconds'] for lookup in lookups)
+            fields = {'resolved': placed,
+                      'off_map': known - placed,
+                      'unmapped': lookups[0]['looked_up'] - known,
+                      'resolve_ms': round(seconds * 1000.0, 3),
+                     }
+            self.add(resolve_seconds_total=seconds, shipments_resolved_total=fields['resolved'],
+                     shipments_off_map_total=fields['off_map'], shipments_unmapped_total=fields['unmapped'])
+        self.record('snapshot', timestamp=timestamp, ppid=ppid, pending=len(shipments), batch_size=batch_size,
+                    **fields)
+
+    def frame(self, timestamp, phases, tiles):
+        # phases = {phase: seconds} of the frame, see PhaseTimings.end_frame()
+        render = sum(seconds for name, seconds in phases.items() if name != 'update')
+        self.add(frames_total=1, render_seconds_total=render, tiles_redrawn_total=tiles,
+                 frame_render_seconds=render)
+        fields = dict((name + '_ms', round(seconds * 1000.0, 3)) for name, seconds in phases.items())
+        self.record('frame', timestamp=timestamp, render_ms=round(render * 1000.0, 3), tiles=tiles, **fields)
+
+    def prometheus(self):
+        # The counters in the Prometheus text exposition format
+        with self.lock:
+            values = dict(self.values)
+        lines = []
+        for name, kind, text in METRIC_TYPES:
+            lines.append('# HELP {}{} {}'.format(PREFIX, name, text))
+            lines.append('# TYPE {}{} {}'.format(PREFIX, name, kind))
+            lines.append('{}{} {}'.format(PREFIX, name, repr(float(values[name]))))
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='127.0.0.1'):
+        # Answer GET /metrics on host:port from a daemon thread
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != '/metrics':
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # no access log on the console
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        thread = threading.Thread(target=self.server.serve_forever, name='metrics')
+        thread.daemon = True
+        thread.start()
+        return self.server
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
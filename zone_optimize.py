@@ -0,0 +1,79 @@
+"""Reorder the batch of every timestamp of the shipments log to walk less.
+
+    python zone_optimize.py [--logs shipments_batchs_logs.txt]
+                            [--out shipments_batchs_logs_optimized.txt]
+                            [--processes N]
+
+Every batch is reordered on the 3F & 3FM distance tables (zone_distance.py)
+with zone_route.optimize_pick_order(): the 3F picks first, then the 3FM
+ones, then the ones on no floor in their old order. Writes the log again
+in the same format with only the batch lists reordered, the timestamps
+spread over a multiprocessing pool."""
+import argparse
+import sys
+
+import numpy as np
+
+from zone_distance import NO_NODE, load_distance_table, location_nodes
+from zone_logs import format_log_line, iter_shipments_batchs_logs
+from zone_route import optimize_pick_order, path_length
+from zone_store import FLOORS, SHARED, fork_pool, pool_chunksize
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reorder every batch of the shipments log to walk less.')
+    parser.add_argument('--logs', default='shipments_batchs_logs.txt', help='the shipments and batchs log')
+    parser.add_argument('--out', default='shipments_batchs_logs_optimized.txt', help='the log to write')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+
+    tables = [load_distance_table(*files) for _, *files in FLOORS]
+    ss_logs = dict(iter_shipments_batchs_logs(args.logs))
+    timestamps = sorted(ss_logs.keys())
+    tasks = [(t, ss_logs[timestamp]['batch']) for t, timestamp in enumerate(timestamps)]
+
+    pool = fork_pool(args.processes, tables=tables)
+    try:
+        chunksize = pool_chunksize(tasks, args.processes)
+        batchs = [None] * len(tasks)
+        before = after = 0
+        for t, batch, length_before, length_after in pool.imap_unordered(optimize_batch, tasks, chunksize):
+            batchs[t] = batch
+            before += length_before
+            after += length_after
+    finally:
+        pool.close()
+        pool.join()
+
+    with open(args.out, 'w') as f:
+        for t, timestamp in enumerate(timestamps):
+            snapshot = dict(ss_logs[timestamp], batch=batchs[t])
+            f.write(format_log_line(timestamp, snapshot))
+    print('{}: {} timestamps, walking {} -> {} tiles'.format(args.out, len(timestamps), before, after))
+
+
+def optimize_batch(task):
+    # Reorder one batch floor by floor. Returns (t, the reordered batch,
+    # the walking distance before and after); walks with floors not joined
+    # count nothing.
+    t, batch = task
+    location_ids = np.array(batch, dtype=np.int64)
+    placed = np.zeros(len(batch), dtype=bool)
+    reordered = []
+    before = after = 0
+    for table in SHARED['tables']:
+        picking, length = optimize_pick_order(table, location_ids)
+        nodes = location_nodes(table, location_ids)
+        on_floor = nodes != NO_NODE
+        placed |= on_floor
+        reordered += location_ids[picking].tolist()
+        length_before = path_length(table['matrix'], nodes[on_floor])
+        if length is not None and length_before is not None:
+            before += length_before
+            after += length
+    reordered += location_ids[~placed].tolist()
+    return t, reordered, before, after
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
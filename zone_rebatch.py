@@ -0,0 +1,74 @@
+"""Batch the pending shipments of every timestamp of the shipments log again,
+with seed-and-grow clustering instead of the batches upstream formed.
+
+    python zone_rebatch.py [--logs shipments_batchs_logs.txt]
+                           [--out shipments_batchs_logs_rebatched.txt]
+                           [--batch-size N]
+
+At every timestamp the pending sequence of the log is batched by
+zone_batching.seed_and_grow() on the 3F & 3FM locations, into batches as
+big as the one of the log unless --batch-size is given. Every batch is
+written as a line of its own, in the same format as the log so the viewer
+shows the new batches with its usual tiles: the sequence still pending and
+the batch taken from it. The first batch, the one seeded by the oldest
+pending shipment, keeps the timestamp of the log line, the n-th one gets
+the timestamp with ' #n' after it, n zero-padded to at least 4 digits,
+e.g. '2018-04-21 10:00:00 #0002'. Compared as strings, like the viewer
+sorts them, the lines of a timestamp then stay in the order they were
+batched and before the next timestamp. Prints how many aisles the batches
+span before and after."""
+import argparse
+import sys
+
+from zone_batching import batch_snapshots, batch_spread, location_keys, seed_and_grow
+from zone_logs import format_log_line, iter_shipments_batchs_logs
+from zone_store import FLOORS, load_floor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batch the pending shipments of the shipments log again.')
+    parser.add_argument('--logs', default='shipments_batchs_logs.txt', help='the shipments and batchs log')
+    parser.add_argument('--out', default='shipments_batchs_logs_rebatched.txt', help='the log to write')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='shipments per batch (default: the size of the batch of the log)')
+    args = parser.parse_args(argv)
+
+    floors_locations = [load_floor(*files)[2] for _, *files in FLOORS]
+    ss_logs = dict(iter_shipments_batchs_logs(args.logs))
+    aisles_before = aisles_after = batches_before = batches_after = 0
+    with open(args.out, 'w') as f:
+        for timestamp in sorted(ss_logs.keys()):
+            snapshot = ss_logs[timestamp]
+            if snapshot['batch']:
+                aisles_before += batch_spread(location_keys(floors_locations, snapshot['batch']))[1]
+                batches_before += 1
+            snapshots = rebatch(floors_locations, snapshot, args.batch_size)
+            if not snapshots:
+                f.write(format_log_line(timestamp, dict(snapshot, batch=[])))
+            width = max(4, len(str(len(snapshots))))
+            for n, new_snapshot in enumerate(snapshots, 1):
+                aisles_after += batch_spread(location_keys(floors_locations, new_snapshot['batch']))[1]
+                batches_after += 1
+                f.write(format_log_line(timestamp if n == 1 else '{} #{:0{}d}'.format(timestamp, n, width), new_snapshot))
+
+    print('{}: {} timestamps, {} batches -> {} batches'.format(args.out, len(ss_logs), batches_before, batches_after))
+    if batches_before and batches_after:
+        print('aisles per batch: {:.2f} -> {:.2f}'.format(aisles_before / batches_before, aisles_after / batches_after))
+
+
+def rebatch(floors_locations, snapshot, batch_size=None):
+    # The snapshots of batching the whole pending sequence of a snapshot
+    # with seed-and-grow, one per batch in the order they are formed, see
+    # batch_snapshots(). The batches are as big as the batch of the snapshot
+    # when batch_size is None; no snapshots when that is empty.
+    if batch_size is None:
+        batch_size = len(snapshot['batch'])
+    if batch_size == 0 or not snapshot['sequence']:
+        return []
+    keys = location_keys(floors_locations, snapshot['sequence'])
+    batches = seed_and_grow(keys, batch_size)
+    return list(batch_snapshots(snapshot['ppid'], snapshot['sequence'], batches))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,134 @@
+import numpy as np
+import pygame
+
+from zone_grid import SYMBOLS
+
+
+def build_tile_atlas(tilemapping, bgcolor):
+    # Keep the pixels of every tile as one array, indexed by the tile code.
+    # atlas = {'pixels': (codes, tile width, tile height) array of mapped
+    #                    pixel values of a pygame.Surface,
+    #          'surfaces': the tile Surface of every code,
+    #          'tile_size': (tile width, tile height)}
+    # Each tile is blitted onto the background color first, the same as
+    # blitting it onto a map surface filled with bgcolor.
+    tile_size = next(iter(tilemapping.values())).get_size()
+    pixels = np.zeros((len(SYMBOLS),) + tile_size, dtype=np.uint32)
+    surfaces = []
+
+    for code, symbol in enumerate(SYMBOLS):
+        tileSurf = pygame.Surface(tile_size)
+        tileSurf.fill(bgcolor)
+        if symbol in tilemapping:
+            if tilemapping[symbol].get_size() != tile_size:
+                raise ValueError('tile {} is not {}x{}'.format(symbol, *tile_size))
+            tileSurf.blit(tilemapping[symbol], (0, 0))
+        pixels[code] = pygame.surfarray.array2d(tileSurf)
+        surfaces.append(tileSurf)
+
+    atlas = {'pixels': pixels,
+             'surfaces': surfaces,
+             'tile_size': tile_size,
+            }
+    return atlas
+
+
+def compose_grid(grid, atlas):
+    # Assemble the pixels of a whole (h, w) level grid with array indexing.
+    # Returns a (w * tile width, h * tile height) array, x first like
+    # pygame.surfarray.
+    tile_w, tile_h = atlas['tile_size']
+    map_h, map_w = grid.shape
+    tiles = atlas['pixels'][grid.T] # (w, h, tile width, tile height)
+    return tiles.transpose(0, 2, 1, 3).reshape(map_w * tile_w, map_h * tile_h)
+
+
+def draw_grid(grid, atlas):
+    # Draw a level grid to a new Surface object in one call
+    tile_w, tile_h = atlas['tile_size']
+    map_h, map_w = grid.shape
+    mapSurf = pygame.Surface((map_w * tile_w, map_h * tile_h))
+    pygame.surfarray.blit_array(mapSurf, compose_grid(grid, atlas))
+    return mapSurf
+
+
+def changed_cells(grid_before, grid_after):
+    # The flat cell numbers whose tile differs between two grids of a floor
+    return np.flatnonzero(grid_before.reshape(-1) != grid_after.reshape(-1))
+
+
+def redraw_cells(surface, grid, cells, atlas, topleft):
+    # Repaint only the tiles of the (sorted) flat cell numbers onto surface,
+    # the top left corner of the map being at topleft. Returns the dirty
+    # Rects to pass to pygame.display.update(), one per run of neighbouring
+    # cells in a row.
+    tile_w, tile_h = atlas['tile_size']
+    map_w = grid.shape[1]
+    flat = grid.reshape(-1)
+    left, top = topleft
+
+    for cell in cells.tolist():
+        y, x = divmod(cell, map_w)
+        surface.blit(atlas['surfaces'][flat[cell]], (left + x * tile_w, top + y * tile_h))
+
+    if len(cells) == 0:
+        return []
+    # split the cells where the next one isn't the right neighbour
+    splits = np.flatnonzero((np.diff(cells) != 1) | (np.diff(cells // map_w) != 0)) + 1
+    rects = []
+    for run in np.split(cells, splits):
+        y, x = divmod(int(run[0]), map_w)
+        rects.append(pygame.Rect(left + x * tile_w, top + y * tile_h, len(run) * tile_w, tile_h))
+    return rects
+
+
+def new_layer(size):
+    # A transparent Surface to collect static graphics on
+    return pygame.Surface(size, pygame.SRCALPHA)
+
+
+def blit_to_layer(layer, surf, rect):
+    # Draw a Surface with per-pixel alpha (e.g. rendered text) onto a layer.
+    # A normal blit would blend the colors with the transparent black of the
+    # layer, so the "over" operator is worked out here: blitting the layer
+    # onto the screen later looks the same as blitting every surf straight
+    # onto the screen in the same order.
+    dest = pygame.Rect(pygame.Rect(rect).topleft, surf.get_size())
+    clipped = dest.clip(layer.get_rect())
+    if clipped.width == 0 or clipped.height == 0:
+        return
+    area = clipped.move(-dest.x, -dest.y)
+    src = surf.subsurface(area)
+    src_color = pygame.surfarray.array3d(src).astype(np.float64)
+    src_alpha = pygame.surfarray.array_alpha(src).astype(np.float64)[..., None] / 255
+
+    x0, y0, x1, y1 = clipped.left, clipped.top, clipped.right, clipped.bottom
+    color = pygame.surfarray.pixels3d(layer)
+    alpha = pygame.surfarray.pixels_alpha(layer)
+    dst_color = color[x0:x1, y0:y1].astype(np.float64)
+    dst_alpha = alpha[x0:x1, y0:y1].astype(np.float64)[..., None] / 255
+
+    out_alpha = src_alpha + dst_alpha * (1 - src_alpha)
+    out_color = src_color * src_alpha + dst_color * dst_alpha * (1 - src_alpha)
+    out_color = np.divide(out_color, out_alpha, out=np.zeros_like(out_color), where=out_alpha > 0)
+
+    color[x0:x1, y0:y1] = np.rint(out_color).astype(np.uint8)
+    alpha[x0:x1, y0:y1] = np.rint(out_alpha[..., 0] * 255).astype(np.uint8)
+    del color, alpha # unlock the layer
+
+
+def blit_layer(surface, layer, dest=(0, 0), area=None):
+    # Composite a layer (or the area of it) onto surface in one blit
+    return surface.blit(layer, dest, area)
+
+
+def draw_route_layer(connectors, grid_shape, path_tiles):
+    # A transparent layer the size of a map with the path tile of every
+    # (cell, connector) of a route, see zone_route.route_connectors()
+    tile_w, tile_h = next(iter(path_tiles.values())).get_size()
+    map_h, map_w = grid_shape
+    layer = new_layer((map_w * tile_w, map_h * tile_h))
+    for cell, connector in connectors:
+        y, x = divmod(cell, map_w)
+        layer.blit(path_tiles[connector], (x * tile_w, y * tile_h))
+    return layer
@@ -0,0 +1,231 @@
+import collections
+
+import numpy as np
+
+from zone_distance import NO_NODE, UNREACHABLE, location_nodes
+from zone_grid import FLOOR
+
+
+def path_length(matrix, nodes):
+    # The walking distance of visiting the nodes in the order given, None
+    # when two consecutive nodes are not joined by any walk
+    nodes = np.asarray(nodes, dtype=np.int64)
+    if len(nodes) < 2:
+        return 0
+    steps = matrix[nodes[:-1], nodes[1:]]
+    if (steps == UNREACHABLE).any():
+        return None
+    return int(steps.sum(dtype=np.int64))
+
+
+def nearest_neighbour_order(matrix, nodes):
+    # Reorder the nodes as a picker who always walks to the nearest pick
+    # left would, starting from the first one. Returns the positions of
+    # the nodes in walking order.
+    nodes = np.asarray(nodes, dtype=np.int64)
+    count = len(nodes)
+    if count < 3:
+        return np.arange(count)
+    distances = matrix[np.ix_(nodes, nodes)].astype(np.int64)
+    visited = np.zeros(count, dtype=bool)
+    order = np.empty(count, dtype=np.int64)
+    current = 0
+    for k in range(count):
+        order[k] = current
+        visited[current] = True
+        if k == count - 1:
+            break
+        row = np.where(visited, np.iinfo(np.int64).max, distances[current])
+        current = int(row.argmin())
+    return order
+
+
+# the directions a path tile connects, as bits
+LEFT, RIGHT, UP, DOWN = 1, 2, 4, 8
+# the connector of every combination of directions, named like the path
+# tiles of the viewer; a dead end is drawn straight through
+CONNECTORS = {LEFT: 'L_R', RIGHT: 'L_R', LEFT | RIGHT: 'L_R',
+              UP: 'U_D', DOWN: 'U_D', UP | DOWN: 'U_D',
+              LEFT | UP: 'L_U', LEFT | DOWN: 'L_D', RIGHT | UP: 'R_U', RIGHT | DOWN: 'R_D',
+              LEFT | UP | DOWN: 'L_U_D', RIGHT | UP | DOWN: 'R_U_D',
+              LEFT | RIGHT | UP: 'L_R_U', LEFT | RIGHT | DOWN: 'L_R_D',
+              LEFT | RIGHT | UP | DOWN: 'L_R_U_D',
+             }
+
+
+def walk_path(walk, start, end):
+    # The flat cells of a shortest walk from start to end over the True
+    # cells of the (h, w) walk mask, both ends included. None when no walk
+    # joins them.
+    height, width = walk.shape
+    walkable = walk.reshape(-1)
+    parent = np.full(height * width, -1, dtype=np.int64)
+    parent[start] = start
+    frontier = collections.deque([start])
+    while frontier and parent[end] < 0:
+        cell = frontier.popleft()
+        y, x = divmod(cell, width)
+        for nb, inside in ((cell - 1, x > 0), (cell + 1, x < width - 1),
+                           (cell - width, y > 0), (cell + width, y < height - 1)):
+            if inside and walkable[nb] and parent[nb] < 0:
+                parent[nb] = cell
+                frontier.append(nb)
+    if parent[end] < 0:
+        return None
+
+    cells = [end]
+    while cells[-1] != start:
+        cells.append(int(parent[cells[-1]]))
+    return cells[::-1]
+
+
+def route_connectors(walk, stops):
+    # The path tiles of walking through the flat cells stops in order:
+    # a list of (cell, connector), one per cell walked, a cell walked more
+    # than once connecting all the ways it was walked
+    height, width = walk.shape
+    directions = {}
+    for start, end in zip(stops[:-1], stops[1:]):
+        cells = walk_path(walk, int(start), int(end))
+        if cells is None:
+            continue # not joined, leave the leg out
+        for a, b in zip(cells[:-1], cells[1:]):
+            if b == a + 1:
+                way_a, way_b = RIGHT, LEFT
+            elif b == a - 1:
+                way_a, way_b = LEFT, RIGHT
+            elif b == a + width:
+                way_a, way_b = DOWN, UP
+            else:
+                way_a, way_b = UP, DOWN
+            directions[a] = directions.get(a, 0) | way_a
+            directions[b] = directions.get(b, 0) | way_b
+    return [(cell, CONNECTORS[ways]) for cell, ways in directions.items()]
+
+
+def route_cells(connectors):
+    # The flat cells of a route_connectors() list, sorted
+    return np.array(sorted(cell for cell, _ in connectors), dtype=np.int64)
+
+
+class RouteCache(object):
+    """The path tiles of the route of every batch, worked out once.
+
+    The picks of a batch on a floor are routed with the nearest neighbour
+    heuristic from the first one, and walked tile by tile with
+    walk_path(). Keeps the routes of the last max_routes batches."""
+
+    def __init__(self, max_routes=256):
+        self.max_routes = max_routes
+        self.routes = collections.OrderedDict() # key = (floor, nodes), value = route_connectors()
+
+    def get(self, floor, grid, table, location_ids):
+        # The route_connectors() of the location ids on this floor, the
+        # same list object as long as the picks stay the same
+        nodes = location_nodes(table, location_ids)
+        nodes = nodes[nodes != NO_NODE]
+        key = (floor, tuple(nodes.tolist()))
+        if key in self.routes:
+            self.routes.move_to_end(key)
+            return self.routes[key]
+
+        order = nearest_neighbour_order(table['matrix'], nodes)
+        route = route_connectors(grid == FLOOR, table['access'][nodes[order]])
+        self.routes[key] = route
+        while len(self.routes) > self.max_routes:
+            self.routes.popitem(last=False)
+        return route
+
+
+def optimize_pick_order(table, location_ids):
+    # Reorder the picks of a batch on one floor to walk as little as
+    # possible. Picks at one access cell are made at one stop, the stops are
+    # ordered by the best of the S-shape, largest gap and nearest neighbour
+    # heuristics, then refined with 2-opt on the distance matrix.
+    # Returns (the positions of the location ids on this floor in picking
+    # order, the walking distance); the ids on other floors are left out.
+    nodes = location_nodes(table, location_ids)
+    positions = np.flatnonzero(nodes != NO_NODE)
+    stops, stop_of = np.unique(nodes[positions], return_inverse=True)
+    if len(stops) == 0:
+        return positions, 0
+
+    ys, xs = np.divmod(table['access'][stops].astype(np.int64), int(table['width']))
+    distances = table['matrix'][np.ix_(stops, stops)].astype(np.int64)
+    candidates = [sshape_order(ys, xs),
+                  largest_gap_order(ys, xs),
+                  nearest_neighbour_order(table['matrix'], stops),
+                 ]
+    order = min(candidates, key=lambda order: distances[order[:-1], order[1:]].sum())
+    order = two_opt(distances, order)
+
+    # the picks of every stop, in the order of the batch within a stop
+    rank = np.empty(len(stops), dtype=np.int64)
+    rank[order] = np.arange(len(stops))
+    picking = positions[np.argsort(rank[stop_of], kind='stable')]
+    return picking, path_length(table['matrix'], stops[order])
+
+
+def sshape_order(ys, xs):
+    # The S-shape route: the aisles (columns) from left to right, walking
+    # down the first, up the next and so on. Returns the positions of the
+    # stops in walking order.
+    aisles = np.unique(xs)
+    upward = np.searchsorted(aisles, xs) % 2 == 1
+    return np.lexsort((np.where(upward, -ys, ys), xs))
+
+
+def largest_gap_order(ys, xs):
+    # The largest gap route: down the first aisle and up the last one; the
+    # aisles in between are entered from both ends, leaving out their
+    # largest gap between picks. The ends of the aisles are the rows of the
+    # first and last stop. Returns the positions of the stops in walking
+    # order.
+    aisles = np.unique(xs)
+    if len(aisles) < 3:
+        return sshape_order(ys, xs)
+    front, back = ys.min(), ys.max()
+    first, last, back_parts, front_parts = [], [], [], []
+    for n, aisle in enumerate(aisles):
+        stops = np.flatnonzero(xs == aisle)
+        stops = stops[np.argsort(ys[stops], kind='stable')]
+        if n == 0:
+            first = list(stops) # down
+        elif n == len(aisles) - 1:
+            last = list(stops[::-1]) # up
+        else:
+            rows = np.concatenate([[front], ys[stops], [back]])
+            gap = int(np.argmax(np.diff(rows))) # the picks before it are walked from the front
+            front_parts.append(list(stops[:gap]))
+            back_parts.append(list(stops[gap:][::-1]))
+    # down the first aisle, along the back picking the back parts, up the
+    # last aisle, back along the front picking the front parts
+    order = first + [s for part in back_parts for s in part] + last
+    order += [s for part in front_parts[::-1] for s in part]
+    return np.array(order, dtype=np.int64)
+
+
+def two_opt(distances, order):
+    # Improve a walking order by reversing the stretch of it that shortens
+    # the walk the most, until none does. The walk may start and end at any
+    # stop, so either end can be moved too. distances is the (stops, stops)
+    # matrix, order the positions of the stops in walking order.
+    count = len(order)
+    if count < 3:
+        return np.asarray(order, dtype=np.int64)
+    # a free end, no distance to anything, around the walk
+    padded = np.zeros((count + 1, count + 1), dtype=np.int64)
+    padded[:count, :count] = distances
+    walk = np.concatenate([[count], order, [count]])
+    while True:
+        # reversing walk[i:j+1] for 1 <= i < j <= count
+        before, first = walk[:-2], walk[1:-1]
+        last, after = walk[1:-1], walk[2:]
+        gain = (padded[before[:, None], last[None, :]] + padded[first[:, None], after[None, :]]
+                - padded[before, first][:, None] - padded[last, after][None, :])
+        gain[np.tril_indices(count)] = 0
+        i, j = np.unravel_index(int(np.argmin(gain)), gain.shape)
+        if gain[i, j] >= 0:
+            break
+        walk[i + 1: j + 2] = walk[i + 1: j + 2][::-1]
+    return walk[1:-1]
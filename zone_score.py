@@ -0,0 +1,130 @@
+"""Walking distance of the batch of every timestamp of the shipments log.
+
+    python zone_score.py [--logs shipments_batchs_logs.txt] [--out zone_scores.csv]
+                         [--processes N]
+
+Every batch is walked on the 3F & 3FM distance tables (zone_distance.py)
+twice: in the order of the log, and in the order of the nearest neighbour
+heuristic, each floor on its own. The in-order distances of the whole log
+are worked out at once with array lookups, the routes are spread over a
+multiprocessing pool. Writes one csv row per timestamp and PPID."""
+import argparse
+import csv
+import sys
+
+import numpy as np
+
+from zone_distance import NO_NODE, UNREACHABLE, load_distance_table, location_nodes
+from zone_logs import iter_shipments_batchs_logs
+from zone_route import nearest_neighbour_order, path_length
+from zone_store import FLOORS, SHARED, fork_pool, pool_chunksize
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Score the walking distance of every batch of the shipments log.')
+    parser.add_argument('--logs', default='shipments_batchs_logs.txt', help='the shipments and batchs log')
+    parser.add_argument('--out', default='zone_scores.csv', help='the csv file to write the scores to')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+
+    tables = dict((floor, load_distance_table(*files)) for floor, *files in FLOORS)
+    ss_logs = dict(iter_shipments_batchs_logs(args.logs))
+    timestamps = sorted(ss_logs.keys())
+    batchs = [ss_logs[timestamp]['batch'] for timestamp in timestamps]
+
+    picks = floor_picks(tables, batchs)
+    in_order = dict((floor, batch_lengths(tables[floor]['matrix'], *picks[floor], len(batchs))) for floor in tables)
+    nearest = route_lengths(tables, picks, len(batchs), args.processes)
+    unmapped = unmapped_counts(picks, batchs)
+    counts = dict((floor, np.bincount(picks[floor][1], minlength=len(batchs))) for floor in tables)
+
+    with open(args.out, 'w', newline='') as f:
+        writer = csv.writer(f)
+        header = ['timestamp', 'ppid', 'batch_size', 'unmapped']
+        for floor in tables:
+            header += ['picks_' + floor, 'in_order_' + floor, 'nearest_' + floor]
+        header += ['in_order', 'nearest', 'saving']
+        writer.writerow(header)
+
+        for t, timestamp in enumerate(timestamps):
+            row = [timestamp, ss_logs[timestamp]['ppid'], len(batchs[t]), unmapped[t]]
+            totals = [0, 0]
+            for floor in tables:
+                row += [int(counts[floor][t]), in_order[floor][t], nearest[floor][t]]
+                totals = add_lengths(totals, [in_order[floor][t], nearest[floor][t]])
+            row += totals
+            row.append('{:.3f}'.format(1 - totals[1] / totals[0]) if totals[0] else '')
+            writer.writerow(['' if value is None else value for value in row])
+    print(args.out, len(timestamps), 'timestamps')
+
+
+def floor_picks(tables, batchs):
+    # The nodes of the picks of every batch on each floor, in batch order,
+    # for the whole log at once: {floor: (nodes, the batch of each node)}
+    location_ids = np.array([x for batch in batchs for x in batch], dtype=np.int64)
+    owner = np.repeat(np.arange(len(batchs)), [len(batch) for batch in batchs])
+    picks = {}
+    for floor, table in tables.items():
+        nodes = location_nodes(table, location_ids)
+        on_floor = nodes != NO_NODE
+        picks[floor] = (nodes[on_floor], owner[on_floor])
+    return picks
+
+
+def batch_lengths(matrix, nodes, owner, count):
+    # The in-order walking distance of every batch of one floor, from one
+    # gather of the consecutive picks of the whole log. None for a batch
+    # with two consecutive picks no walk joins.
+    same = owner[:-1] == owner[1:]
+    steps = matrix[nodes[:-1][same], nodes[1:][same]].astype(np.int64)
+    batch = owner[:-1][same]
+    lengths = np.bincount(batch, weights=steps, minlength=count).astype(np.int64)
+    broken = np.bincount(batch, weights=steps == UNREACHABLE, minlength=count) > 0
+    return [None if b else int(n) for n, b in zip(lengths, broken)]
+
+
+def route_lengths(tables, picks, count, processes):
+    # The nearest neighbour distance of every batch of each floor, the
+    # batches spread over a pool: {floor: [length per batch]}
+    tasks = []
+    for floor in tables:
+        nodes, owner = picks[floor]
+        bounds = np.searchsorted(owner, np.arange(count + 1))
+        tasks += [(floor, t, nodes[bounds[t]: bounds[t+1]]) for t in range(count)]
+
+    matrices = dict((floor, table['matrix']) for floor, table in tables.items())
+    pool = fork_pool(processes, matrices=matrices)
+    try:
+        chunksize = pool_chunksize(tasks, processes)
+        lengths = dict((floor, [0] * count) for floor in tables)
+        for floor, t, length in pool.imap_unordered(route_batch, tasks, chunksize):
+            lengths[floor][t] = length
+    finally:
+        pool.close()
+        pool.join()
+    return lengths
+
+
+def route_batch(task):
+    # The nearest neighbour distance of the picks of one batch on one floor
+    floor, t, nodes = task
+    matrix = SHARED['matrices'][floor]
+    order = nearest_neighbour_order(matrix, nodes)
+    return floor, t, path_length(matrix, nodes[order])
+
+
+def unmapped_counts(picks, batchs):
+    # The picks of every batch that are on no floor
+    placed = np.zeros(len(batchs), dtype=np.int64)
+    for nodes, owner in picks.values():
+        placed += np.bincount(owner, minlength=len(batchs))
+    return [len(batch) - int(n) for batch, n in zip(batchs, placed)]
+
+
+def add_lengths(totals, lengths):
+    # Sum lengths into totals, None once a part is None
+    return [None if a is None or b is None else a + b for a, b in zip(totals, lengths)]
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+from zone_grid import encode_map
+from zone_locations import build_location_index, compile_layout, read_layout_file
+
+# Bump when the compiled data changes meaning (e.g. compile_layout() places
+# the locations differently, the distance tables get another array), so
+# every cache gets rebuilt
+CACHE_VERSION = 3
+
+# The floors of the 3F & 3FM tools: (floor, zone map, locations csv, layout)
+FLOORS = [('3F', '3F_zone_maps.txt', 'locations_3F.csv', '3F_zone_layout.json'),
+          ('3FM', '3FM_zone_maps.txt', 'locations_3FM.csv', '3FM_zone_layout.json'),
+         ]
+
+# what fork_pool() hands to its workers, read by the worker functions
+SHARED = {}
+
+
+def load_floor(zone_filename, locations_filename, layout_filename):
+    # The encoded zone map and the location index of one floor, from the
+    # compiled cache next to the locations csv when it is up to date, so a
+    # warm start neither imports pandas nor parses the text files.
+    # The locations are placed by the layout description of the floor,
+    # see read_layout_file().
+    # Returns (grid, location_index, locations), locations being the columns
+    # of the csv in the order of location_index['ids']:
+    #   {'ids': , 'zone': codes into 'zone_names', 'zone_names': , 'aisle': , 'bay': }
+    cache_filename = os.path.splitext(locations_filename)[0] + '.npz'
+    sources = [zone_filename, locations_filename, layout_filename]
+
+    data = read_cache(cache_filename, sources)
+    if data is None:
+        # stamped before parsing, an edit made meanwhile rebuilds next time
+        stamps = dict((filename, source_stamp(filename)) for filename in sources)
+        data = compile_floor(zone_filename, locations_filename, layout_filename)
+        write_cache(cache_filename, stamps, data)
+
+    location_index = {'ids': data['ids'],
+                      'cells': data['cells'],
+                      'height': int(data['grid'].shape[0]),
+                      'width': int(data['grid'].shape[1]),
+                     }
+    locations = {'ids': data['ids'],
+                 'zone': data['zone'],
+                 'zone_names': data['zone_names'],
+                 'aisle': data['aisle'],
+                 'bay': data['bay'],
+                }
+    return data['grid'], location_index, locations
+
+
+def read_zone_map(filename):
+    # Parse a text zone map, one space separated tile per column, into a
+    # 2-d uint8 grid
+    with open(filename, 'r') as f:
+        lines = f.readlines()
+    return encode_map([line.rstrip().split(' ') for line in lines])
+
+
+def compile_floor(zone_filename, locations_filename, layout_filename):
+    # Parse the text files of one floor into the arrays kept in the cache
+    import pandas as pd # only needed when the cache is rebuilt
+
+    grid = read_zone_map(zone_filename)
+    tables = compile_layout(read_layout_file(layout_filename), grid.shape[0], grid.shape[1])
+    locations_df = pd.read_csv(locations_filename, index_col = 0)
+    index = build_location_index(locations_df, tables)
+
+    # the csv columns in the sorted order of index['ids']
+    order = np.argsort(locations_df.index.to_numpy(dtype=np.int64), kind='stable')
+    zone_names, zone = np.unique(locations_df['zone'].to_numpy(dtype=str), return_inverse=True)
+    data = {'grid': grid,
+            'ids': index['ids'],
+            'cells': index['cells'],
+            'zone': zone[order].astype(np.int16),
+            'zone_names': zone_names,
+            'aisle': locations_df['aisle'].to_numpy(dtype=np.int32)[order],
+            'bay': locations_df['bay'].to_numpy(dtype=np.int32)[order],
+           }
+    return data
+
+
+def source_stamp(filename, digest=True):
+    # What a source file looked like when the cache was compiled
+    stat = os.stat(filename)
+    stamp = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+    if digest:
+        with open(filename, 'rb') as f:
+            stamp['sha1'] = hashlib.sha1(f.read()).hexdigest()
+    return stamp
+
+
+def read_cache(cache_filename, sources):
+    # The arrays of the cache, or None when it is missing, unreadable or
+    # older than the sources. A source whose mtime changed but whose
+    # content hash didn't (a touch or a fresh checkout) still matches, the
+    # new mtimes are written back so the next start skips the hashing.
+    try:
+        with np.load(cache_filename, allow_pickle=False) as npz:
+            data = dict((key, npz[key]) for key in npz.files)
+        meta = json.loads(str(data.pop('meta')))
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+    if meta.get('version') != CACHE_VERSION or sorted(meta.get('sources', {})) != sorted(sources):
+        return None
+
+    stamps = meta['sources']
+    restamp = False
+    for filename in sources:
+        try:
+            current = source_stamp(filename, digest=False)
+            if current['mtime_ns'] == stamps[filename]['mtime_ns'] and current['size'] == stamps[filename]['size']:
+                continue
+            current = source_stamp(filename)
+        except OSError:
+            return None
+        if current['sha1'] != stamps[filename]['sha1']:
+            return None
+        stamps[filename] = current
+        restamp = True
+
+    if restamp:
+        write_cache(cache_filename, stamps, data)
+    return data
+
+
+def write_cache(cache_filename, stamps, data):
+    # Save the arrays with the stamps of the sources. The file is replaced
+    # in one step, so viewers starting at the same time never read half a
+    # cache. A directory we can't write to only costs the next start time.
+    meta = {'version': CACHE_VERSION,
+            'sources': stamps,
+           }
+    directory = os.path.dirname(os.path.abspath(cache_filename))
+    try:
+        fd, tmp_filename = tempfile.mkstemp(suffix='.npz', dir=directory)
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **data)
+        # mkstemp() makes the file private, give it the usual permissions
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(tmp_filename, 0o666 & ~umask)
+        os.replace(tmp_filename, cache_filename)
+    except OSError:
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+
+
+def fork_pool(processes=None, initializer=None, **shared):
+    # A multiprocessing pool whose workers find the keyword arguments in
+    # SHARED, then run initializer() when given. fork shares them with the
+    # workers copy-on-write, other start methods pickle them once per
+    # worker.
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+    return context.Pool(processes, initializer=init_shared, initargs=(shared, initializer))
+
+
+def init_shared(shared, initializer=None):
+    SHARED.update(shared)
+    if initializer is not None:
+        initializer()
+
+
+def pool_chunksize(tasks, processes=None):
+    # The tasks to send a worker at a time, about four rounds per worker
+    return max(1, len(tasks) // (4 * (processes or os.cpu_count() or 1)))
@@ -0,0 +1,89 @@
+"""Replay the shipments log through an online batcher, line by line.
+
+    python zone_stream.py [--logs shipments_batchs_logs.txt]
+                          [--out shipments_batchs_logs_online.txt]
+                          [--batch-size 20] [--max-wait 600] [--max-open 4]
+                          [--follow]
+
+The shipments that arrive at a timestamp are the ones of its pending
+sequence that were not pending at the timestamp before. They are folded
+into a zone_batching.OnlineBatcher, which closes batches when they are full
+or have waited --max-wait seconds. Every line is written again with the
+batches closed at its timestamp as its batch, so the viewer shows them with
+its usual tiles, and the latency of every update is printed. With --follow
+the log is tailed and batched as it is written, until ctrl-c."""
+import argparse
+import collections
+import datetime
+import sys
+import time
+
+import numpy as np
+
+from zone_batching import OnlineBatcher
+from zone_logs import follow_lines, format_log_line, parse_log_line
+from zone_store import FLOORS, load_floor
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+POLL_SECONDS = 0.5 # how often a followed log is checked for new lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay the shipments log through an online batcher.')
+    parser.add_argument('--logs', default='shipments_batchs_logs.txt', help='the shipments and batchs log')
+    parser.add_argument('--out', default='shipments_batchs_logs_online.txt', help='the log to write')
+    parser.add_argument('--batch-size', type=int, default=20, help='close a batch at this many shipments')
+    parser.add_argument('--max-wait', type=float, default=600, help='close a batch open this many seconds')
+    parser.add_argument('--max-open', type=int, default=4, help='batches open at once')
+    parser.add_argument('--follow', action='store_true', help='keep batching the lines appended to the log')
+    args = parser.parse_args(argv)
+
+    floors_locations = [load_floor(*files)[2] for _, *files in FLOORS]
+    batcher = OnlineBatcher(floors_locations, args.batch_size, args.max_wait, args.max_open)
+    pending = collections.Counter() # the sequence of the line before
+    latencies = []
+    batch_count = 0
+    with open(args.out, 'w') as f:
+        try:
+            for line in follow_lines(args.logs, args.follow):
+                if line is None:
+                    time.sleep(POLL_SECONDS)
+                    continue
+                if not line.strip() or (args.follow and not line.endswith('\n')):
+                    continue # blank, or still being written
+                timestamp, snapshot = parse_log_line(line)
+                arrived, pending = new_shipments(pending, snapshot['sequence'])
+
+                closed = batcher.update(timestamp_seconds(timestamp), arrived)
+                latencies.append(batcher.latency)
+                batch_count += len(closed)
+                batch = [x for b in closed for x in b['ids']]
+                f.write(format_log_line(timestamp, dict(snapshot, batch=batch)))
+                f.flush()
+                print('{}  +{} shipments  {} pending  {} open  {} closed  {:.3f} ms'.format(
+                      timestamp, len(arrived), len(batcher), len(batcher.open), len(closed), batcher.latency * 1000.0))
+        except KeyboardInterrupt:
+            pass
+
+    if latencies:
+        ms = np.array(latencies) * 1000.0
+        print('{}: {} updates, {} batches, update ms mean {:.3f} p95 {:.3f} max {:.3f}'.format(
+              args.out, len(latencies), batch_count, ms.mean(), np.percentile(ms, 95), ms.max()))
+
+
+def new_shipments(pending, sequence):
+    # The shipments of a pending sequence that were not pending before, a
+    # shipment pending twice counting twice. pending is the Counter of the
+    # sequence before. Returns (the new shipments, the Counter of sequence).
+    sequence = collections.Counter(sequence)
+    return list((sequence - pending).elements()), sequence
+
+
+def timestamp_seconds(timestamp):
+    # The seconds since the epoch of a timestamp of the log, the ' #0002'
+    # of the extra batches of zone_rebatch.py left out
+    return datetime.datetime.strptime(timestamp.split(' #')[0], TIME_FORMAT).timestamp()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,173 @@
+"""What-if sweep of the batching of the shipments log over batch sizes and
+policies.
+
+    python zone_sweep.py [--logs shipments_batchs_logs.txt] [--out zone_sweep.csv]
+                         [--batch-sizes 20,40,80] [--policies log,fifo,seed,online]
+                         [--max-wait 600] [--max-open 4] [--processes N]
+
+The policies are
+    log     the batches of the log itself, whatever the batch size
+    fifo    the oldest pending shipments of every timestamp
+    seed    the first seed-and-grow batch of every timestamp, the first line
+            zone_rebatch.py writes for it
+    online  the batches closed by an OnlineBatcher fed the log line by line,
+            zone_stream.py
+Every batch is walked with the nearest neighbour route on the 3F & 3FM
+distance tables, each floor on its own, and counted for the zones and
+aisles it covers. The timestamps of the offline policies are spread over a
+multiprocessing pool in chunks, an online replay is one task as it runs in
+order; the workers share the log, the locations and the distance tables
+with the parent. Prints one summary row per configuration and writes them
+to a csv."""
+import argparse
+import collections
+import csv
+import sys
+
+import numpy as np
+
+from zone_batching import OnlineBatcher, batch_spread, location_keys, seed_and_grow
+from zone_distance import NO_NODE, load_distance_table, location_nodes
+from zone_logs import iter_shipments_batchs_logs
+from zone_route import nearest_neighbour_order, path_length
+from zone_store import FLOORS, SHARED, fork_pool, load_floor, pool_chunksize
+from zone_stream import new_shipments, timestamp_seconds
+
+POLICIES = ['log', 'fifo', 'seed', 'online']
+# the totals kept for every configuration
+TOTALS = ['batches', 'picks', 'walk', 'unreachable', 'zones', 'aisles']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sweep the batching of the shipments log over batch sizes and policies.')
+    parser.add_argument('--logs', default='shipments_batchs_logs.txt', help='the shipments and batchs log')
+    parser.add_argument('--out', default='zone_sweep.csv', help='the csv file to write the summary to')
+    parser.add_argument('--batch-sizes', default='20,40,80', help='comma separated batch sizes')
+    parser.add_argument('--policies', default=','.join(POLICIES), help='comma separated policies')
+    parser.add_argument('--max-wait', type=float, default=600, help='online: close a batch open this many seconds')
+    parser.add_argument('--max-open', type=int, default=4, help='online: batches open at once')
+    parser.add_argument('--processes', type=int, default=None, help='worker processes (default: one per CPU)')
+    args = parser.parse_args(argv)
+
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',') if size]
+    policies = [policy for policy in args.policies.split(',') if policy]
+    for policy in policies:
+        if policy not in POLICIES:
+            parser.error('unknown policy {!r}, choose from {}'.format(policy, ', '.join(POLICIES)))
+    configurations = []
+    for policy in policies:
+        configurations += [(policy, None)] if policy == 'log' else [(policy, size) for size in batch_sizes]
+
+    floors_locations = [load_floor(*files)[2] for _, *files in FLOORS]
+    tables = [load_distance_table(*files) for _, *files in FLOORS]
+    ss_logs = dict(iter_shipments_batchs_logs(args.logs))
+    snapshots = [(timestamp, ss_logs[timestamp]) for timestamp in sorted(ss_logs.keys())]
+
+    chunk = pool_chunksize(snapshots, args.processes)
+    tasks = []
+    for policy, size in configurations:
+        if policy == 'online':
+            tasks.append((policy, size, 0, len(snapshots)))
+        else:
+            tasks += [(policy, size, start, min(start + chunk, len(snapshots))) for start in range(0, len(snapshots), chunk)]
+    tasks.sort(key=lambda task: task[2] - task[3]) # the long ones first
+
+    options = {'max_wait': args.max_wait, 'max_open': args.max_open}
+    pool = fork_pool(args.processes, snapshots=snapshots, floors_locations=floors_locations,
+                     tables=tables, options=options)
+    try:
+        totals = dict((configuration, dict.fromkeys(TOTALS, 0)) for configuration in configurations)
+        for configuration, part in pool.imap_unordered(sweep_task, tasks):
+            for name in TOTALS:
+                totals[configuration][name] += part[name]
+    finally:
+        pool.close()
+        pool.join()
+
+    rows = [summary_row(policy, size, totals[(policy, size)]) for policy, size in configurations]
+    header = ['policy', 'batch_size', 'batches', 'picks_per_batch', 'walk_per_batch', 'walk_per_pick',
+              'zones_per_batch', 'aisles_per_batch', 'unreachable']
+    with open(args.out, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+    print('{:<8} {:>10} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10} {:>11}'.format(*header[:2], 'batches', 'picks/b',
+          'walk/b', 'walk/pick', 'zones/b', 'aisles/b', 'unreachable'))
+    for row in rows:
+        print('{:<8} {:>10} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10} {:>11}'.format(*row))
+    print('saved', args.out)
+
+
+def summary_row(policy, size, totals):
+    # The csv row of one configuration, the means per batch and per pick
+    batches = totals['batches']
+    mean = lambda value: '{:.2f}'.format(value / batches) if batches else ''
+    row = [policy, '' if size is None else size, batches, mean(totals['picks']), mean(totals['walk']),
+           '{:.2f}'.format(totals['walk'] / totals['picks']) if totals['picks'] else '',
+           mean(totals['zones']), mean(totals['aisles']), totals['unreachable']]
+    return row
+
+
+def sweep_task(task):
+    # The totals of the batches of one configuration over the timestamps
+    # start ~ stop. Returns ((policy, batch size), totals).
+    policy, size, start, stop = task
+    totals = dict.fromkeys(TOTALS, 0)
+    for batch in replay(policy, size, SHARED['snapshots'][start: stop]):
+        if not batch:
+            continue
+        walk = batch_walk(batch)
+        zones, aisles = batch_spread(location_keys(SHARED['floors_locations'], batch))
+        totals['batches'] += 1
+        totals['picks'] += len(batch)
+        totals['zones'] += zones
+        totals['aisles'] += aisles
+        if walk is None:
+            totals['unreachable'] += 1
+        else:
+            totals['walk'] += walk
+    return (policy, size), totals
+
+
+def replay(policy, size, snapshots):
+    # Yield the batches, lists of location ids, a policy forms over the
+    # (timestamp, snapshot) of the log
+    if policy == 'online':
+        options = SHARED['options']
+        batcher = OnlineBatcher(SHARED['floors_locations'], size, options['max_wait'], options['max_open'])
+        pending = collections.Counter()
+        for timestamp, snapshot in snapshots:
+            arrived, pending = new_shipments(pending, snapshot['sequence'])
+            for batch in batcher.update(timestamp_seconds(timestamp), arrived):
+                yield batch['ids']
+        return # the batches still open at the end of the log are left out
+
+    for timestamp, snapshot in snapshots:
+        if policy == 'log':
+            yield snapshot['batch']
+        elif policy == 'fifo':
+            yield snapshot['sequence'][:size]
+        elif snapshot['sequence']:
+            keys = location_keys(SHARED['floors_locations'], snapshot['sequence'])
+            batch, = seed_and_grow(keys, size, max_batches=1)
+            yield [snapshot['sequence'][i] for i in batch]
+
+
+def batch_walk(batch):
+    # The nearest neighbour walking distance of a batch, every floor walked
+    # on its own, None when two of its picks on a floor are not joined
+    location_ids = np.array(batch, dtype=np.int64)
+    walk = 0
+    for table in SHARED['tables']:
+        nodes = location_nodes(table, location_ids)
+        nodes = nodes[nodes != NO_NODE]
+        length = path_length(table['matrix'], nodes[nearest_neighbour_order(table['matrix'], nodes)])
+        if length is None:
+            return None
+        walk += length
+    return walk
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,187 @@
+"""Synthetic warehouse data in the formats of the bundled files, at any scale.
+
+    python zone_synth.py OUT [--floors 2] [--zones 6] [--aisles 20] [--bays 40]
+                             [--timestamps 1000] [--shipments 300]
+                             [--batch-size 20] [--batch-dist poisson]
+                             [--skew 1.0] [--churn 0.1] [--seed 0]
+
+Writes, for every floor, <floor>_zone_maps.txt, <floor>_zone_layout.json
+and locations_<floor>.csv, and one shipments_batchs_logs.txt picking from
+all the floors. The first two floors are named 3F and 3FM, so the viewer
+runs on OUT as it is. The log is written a line at a time: only the
+locations and one snapshot are kept in memory, however many timestamps
+are asked for."""
+import argparse
+import datetime
+import json
+import os
+import string
+import sys
+
+import numpy as np
+
+FLOOR_NAMES = ['3F', '3FM']
+FIRST_LOCATION_ID = 100000
+START_TIME = datetime.datetime(2018, 4, 21, 10, 0, 0)
+PPID = 123456
+AISLE_STEP = 3 # columns per aisle: odd bays, walkway, even bays
+ZONE_GAP = 2   # walkway columns between two zones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write synthetic zone maps, locations and shipments logs.')
+    parser.add_argument('out', help='the directory to write the files to')
+    parser.add_argument('--floors', type=int, default=2, help='number of floors')
+    parser.add_argument('--zones', type=int, default=6, help='zones per floor')
+    parser.add_argument('--aisles', type=int, default=20, help='aisles per zone')
+    parser.add_argument('--bays', type=int, default=40, help='bays per aisle')
+    parser.add_argument('--timestamps', type=int, default=1000, help='lines of the shipments log')
+    parser.add_argument('--interval', type=int, default=60, help='seconds between two timestamps')
+    parser.add_argument('--shipments', type=int, default=300, help='pending shipments per snapshot')
+    parser.add_argument('--batch-size', type=float, default=20, help='mean number of batched shipments per snapshot')
+    parser.add_argument('--batch-dist', choices=['poisson', 'geometric', 'fixed'], default='poisson',
+                        help='distribution of the batch size')
+    parser.add_argument('--skew', type=float, default=1.0,
+                        help='pick frequency skew, the k-th most picked location is picked ~ 1/k^skew (0: uniform)')
+    parser.add_argument('--churn', type=float, default=0.1, help='share of the pending shipments replaced per timestamp')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.out):
+        os.makedirs(args.out)
+    rng = np.random.default_rng(args.seed)
+
+    location_ids = []
+    next_id = FIRST_LOCATION_ID
+    for floor in floor_names(args.floors):
+        ids = write_floor(args.out, floor, args.zones, args.aisles, args.bays, next_id, rng)
+        location_ids.append(ids)
+        next_id += len(ids)
+        print(floor, len(ids), 'locations')
+    location_ids = np.concatenate(location_ids)
+
+    picks = PickSampler(location_ids, args.skew, rng)
+    filename = os.path.join(args.out, 'shipments_batchs_logs.txt')
+    write_logs(filename, picks, rng, args.timestamps, args.interval, args.shipments,
+               args.batch_size, args.batch_dist, args.churn)
+    print(filename, os.path.getsize(filename), 'bytes')
+
+
+def floor_names(count):
+    # 3F, 3FM, 4F, 5F, ...
+    names = FLOOR_NAMES[:count]
+    names += ['{}F'.format(n + 4) for n in range(count - len(names))]
+    return names
+
+
+def zone_names(count):
+    # A, B, ..., Z, AA, AB, ...
+    letters = string.ascii_uppercase
+    names = []
+    for n in range(count):
+        name = ''
+        n += 1
+        while n:
+            n, r = divmod(n - 1, len(letters))
+            name = letters[r] + name
+        names.append(name)
+    return names
+
+
+def write_floor(out, floor, zones, aisles, bays, first_id, rng):
+    # Write the zone map, the layout and the locations of one floor: the
+    # zones side by side, every aisle a walkway with the odd bays on its
+    # left and the even bays on its right, like 3FM_zone_layout.json.
+    # Returns the location ids of the floor.
+    rows = (bays + 1) // 2
+    height = rows + 2
+    zone_width = AISLE_STEP * aisles
+    width = zones * (zone_width + ZONE_GAP) + ZONE_GAP
+
+    grid = np.full((height, width), '.', dtype='<U1')
+    layout = {'floor': floor, 'zones': {}}
+    for z, zone in enumerate(zone_names(zones)):
+        left = ZONE_GAP + z * (zone_width + ZONE_GAP)
+        layout['zones'][zone] = [{'aisles': [0, aisles - 1],
+                                  'x': [AISLE_STEP, left + 1],
+                                  'odd': -1,
+                                  'even': 1,
+                                  'bays': [[1, bays, 0]],
+                                 }]
+        walkways = left + 1 + AISLE_STEP * np.arange(aisles)
+        grid[1: 1 + rows, walkways[:, None] + np.array([-1, 1])] = '#'
+
+    with open(os.path.join(out, '{}_zone_maps.txt'.format(floor)), 'w') as f:
+        for row in grid:
+            f.write(' '.join(row) + '\n')
+    with open(os.path.join(out, '{}_zone_layout.json'.format(floor)), 'w') as f:
+        json.dump(layout, f, indent=1)
+
+    # the location ids in no particular order, as in the bundled csv
+    count = zones * aisles * bays
+    ids = first_id + rng.permutation(count)
+    with open(os.path.join(out, 'locations_{}.csv'.format(floor)), 'w') as f:
+        f.write('locationid,zone,aisle,bay\n')
+        n = 0
+        for zone in zone_names(zones):
+            for aisle in range(aisles):
+                for bay in range(1, bays + 1):
+                    f.write('{},{},{},{}\n'.format(ids[n], zone, aisle, bay))
+                    n += 1
+    return ids
+
+
+class PickSampler(object):
+    """Location ids drawn with a Zipf-like pick frequency.
+
+    The locations are ranked at random and the k-th one is picked with a
+    weight of 1/k^skew, skew=0 picks every location alike."""
+
+    def __init__(self, location_ids, skew, rng):
+        self.rng = rng
+        self.location_ids = location_ids[rng.permutation(len(location_ids))]
+        weights = np.arange(1, len(location_ids) + 1, dtype=np.float64) ** -skew
+        self.cumulative = np.cumsum(weights)
+        self.cumulative /= self.cumulative[-1]
+
+    def __call__(self, size):
+        pos = np.searchsorted(self.cumulative, self.rng.random(size), side='right')
+        return self.location_ids[np.minimum(pos, len(self.location_ids) - 1)]
+
+
+def batch_size(rng, mean, dist):
+    if dist == 'fixed':
+        return int(round(mean))
+    if dist == 'geometric':
+        return int(rng.geometric(1.0 / (mean + 1))) - 1 if mean > 0 else 0
+    return int(rng.poisson(mean))
+
+
+def write_logs(filename, picks, rng, timestamps, interval, shipments, mean_batch, batch_dist, churn):
+    # Stream the shipments log: every line the pending shipments of the line
+    # before, churn of them replaced by new picks, with a batch taken out of
+    # the pending ones
+    pending = picks(shipments)
+    replaced = int(round(churn * shipments))
+    ppid = PPID
+    with open(filename, 'w') as f:
+        for t in range(timestamps):
+            if t and replaced:
+                pending[rng.choice(shipments, replaced, replace=False)] = picks(replaced)
+            size = min(batch_size(rng, mean_batch, batch_dist), shipments)
+            batch = pending[rng.choice(shipments, size, replace=False)] if size else pending[:0]
+            if size:
+                ppid += 1 # a new batch job
+
+            timestamp = START_TIME + datetime.timedelta(seconds=interval * t)
+            f.write('{},{},'.format(timestamp.strftime('%Y-%m-%d %H:%M:%S'), ppid))
+            if shipments:
+                f.write(','.join(map(str, pending.tolist())) + ',')
+            f.write(';')
+            if size:
+                f.write(',' + ','.join(map(str, batch.tolist())))
+            f.write('\n')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
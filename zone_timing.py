@@ -0,0 +1,89 @@
+import collections
+import time
+
+import numpy as np
+
+
+class PhaseTimings(object):
+    """Rolling timings of the phases of a frame, for the timing HUD.
+
+    The time spent in each phase is measured with time.perf_counter(), a
+    monotonic clock that costs well under a microsecond to read:
+
+        with timings.phase('draw'):
+            ...
+        timings.end_frame(tiles=123)
+
+    A phase entered several times in a frame counts once with the sum of
+    its blocks. end_frame() records the frame, for the frames per second
+    and the tiles it redrew; the last window frames are kept."""
+
+    def __init__(self, phases, window=120):
+        self.phases = list(phases)
+        self.samples = dict((name, collections.deque(maxlen=window)) for name in self.phases)
+        self.frame_ends = collections.deque(maxlen=window) # perf_counter() at the end of each frame
+        self.tiles = 0 # the tiles redrawn by the last frame
+        self.current = {} # the seconds of the phases of the frame being drawn
+        self.timers = dict((name, _PhaseTimer(self, name)) for name in self.phases)
+
+    def phase(self, name):
+        # A context manager adding the time spent in its block to phase name
+        return self.timers[name]
+
+    def add(self, name, seconds):
+        self.current[name] = self.current.get(name, 0.0) + seconds
+
+    def end_frame(self, tiles=0):
+        # Returns {phase: seconds} of the frame
+        phases = self.current
+        for name, seconds in phases.items():
+            self.samples[name].append(seconds)
+        self.current = {}
+        self.frame_ends.append(time.perf_counter())
+        self.tiles = tiles
+        return phases
+
+    def stats(self, name):
+        # (last, mean, p95) of a phase in milliseconds, None before its
+        # first frame
+        samples = self.samples[name]
+        if not samples:
+            return None
+        ms = np.array(samples) * 1000.0
+        return ms[-1], ms.mean(), np.percentile(ms, 95)
+
+    def fps(self):
+        # Frames drawn in the last second
+        now = time.perf_counter()
+        return sum(1 for end in self.frame_ends if now - end <= 1.0)
+
+    def summary(self):
+        # One line of text: last/mean/p95 ms of every phase, the frames per
+        # second and the tiles redrawn by the last frame
+        parts = ['ms last/mean/p95']
+        for name in self.phases:
+            stats = self.stats(name)
+            if stats is None:
+                parts.append('{} -'.format(name))
+            else:
+                parts.append('{} {:.1f}/{:.1f}/{:.1f}'.format(name, *stats))
+        parts.append('{} fps'.format(self.fps()))
+        parts.append('{} tiles'.format(self.tiles))
+        return '  '.join(parts)
+
+
+class _PhaseTimer(object):
+    # The context manager of PhaseTimings.phase(), one per phase, reused
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timings.add(self.name, time.perf_counter() - self.start)
+        return False